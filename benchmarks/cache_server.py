@@ -0,0 +1,129 @@
+''' Local stand-in for the spacetime cache server.
+
+    python3 -m benchmarks.cache_server --port 9000 --latency 20
+
+Answers GET /?q=<url>&u=<useragent> the way the real cache does: a CBOR map
+with url, status and a pickled requests.Response. Pages are generated from
+the requested url, so any url "exists", and each links to a few other pages
+on its host. Latency, 503 errors and stalls can be injected to exercise the
+download client. Point a crawl at it with launch.py --cache_server. '''
+import time
+import random
+import pickle
+import hashlib
+import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from argparse import ArgumentParser
+from urllib.parse import urlparse, parse_qs
+
+import cbor
+import requests
+
+
+def make_raw_response(url, status, content, content_type="text/html"):
+    resp = requests.models.Response()
+    resp.url = url
+    resp.status_code = status
+    resp._content = content
+    resp.headers["Content-Type"] = content_type
+    resp.headers["Content-Length"] = str(len(content))
+    resp.encoding = "utf-8"
+    resp.elapsed = datetime.timedelta(0)
+    return resp
+
+
+def encode_reply(url, status, raw_response=None, error=None):
+    reply = {"url": url, "status": status}
+    if raw_response is not None:
+        reply["response"] = pickle.dumps(raw_response)
+    if error is not None:
+        reply["error"] = error
+    return cbor.dumps(reply)
+
+
+def synthetic_page(url, links=5, words=300):
+    ''' A deterministic html page for url: words of body text and links to
+        other numbered pages on the same host. '''
+    seed = int(hashlib.md5(url.encode("utf-8")).hexdigest()[:8], 16)
+    rand = random.Random(seed)
+    parsed = urlparse(url)
+    base = f"{parsed.scheme}://{parsed.netloc}"
+    body = " ".join(f"word{rand.randrange(2000)}" for _ in range(words))
+    anchors = "".join(
+        f'<a href="{base}/page/{rand.randrange(100000)}">link</a> '
+        for _ in range(links))
+    return (f"<html><head><title>{url}</title></head><body>"
+            f"<p>{body}</p>{anchors}</body></html>").encode("utf-8")
+
+
+class CacheHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Send headers and body in one write, a split write stalls keep-alive
+    # clients on delayed ACKs.
+    wbufsize = -1
+
+    def do_GET(self):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        if random.random() < server.stall_rate:
+            time.sleep(server.stall)
+        if random.random() < server.error_rate:
+            self.reply(503, b"")
+            return
+        query = parse_qs(urlparse(self.path).query)
+        url = query.get("q", [""])[0]
+        self.reply(200, server.resolve(url))
+
+    def reply(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/cbor")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class CacheServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0, error_rate=0, stall_rate=0,
+                 stall=60):
+        super().__init__(address, CacheHandler)
+        # Seconds added to every reply.
+        self.latency = latency
+        # Fraction of requests answered with a bare 503.
+        self.error_rate = error_rate
+        # Fraction of requests that hang for stall seconds first.
+        self.stall_rate = stall_rate
+        self.stall = stall
+
+    def resolve(self, url):
+        ''' The cbor reply for url. Override for other content. '''
+        raw = make_raw_response(url, 200, synthetic_page(url))
+        return encode_reply(url, 200, raw)
+
+    def start(self):
+        ''' Serve from a daemon thread, returns the (host, port) to use as
+            config.cache_server. '''
+        Thread(target=self.serve_forever, daemon=True).start()
+        return self.server_address[:2]
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0,
+                        help="milliseconds added to every reply")
+    parser.add_argument("--error_rate", type=float, default=0)
+    parser.add_argument("--stall_rate", type=float, default=0)
+    args = parser.parse_args()
+    server = CacheServer(
+        (args.host, args.port), args.latency / 1000, args.error_rate,
+        args.stall_rate)
+    print(f"Serving on {args.host}:{args.port}")
+    server.serve_forever()
@@ -0,0 +1,222 @@
+''' End-to-end crawl benchmark against a local cache server.
+
+    python3 -m benchmarks.crawl --mode threads --threads 8 --hosts 5 --pages 400
+    python3 -m benchmarks.crawl --replay crawl.rec --json today.json
+    python3 -m benchmarks.crawl --baseline today.json
+
+Crawls the synthetic site of benchmarks.site (or a recording made with
+benchmarks.replay) from a scratch directory with the settings of
+config.ini, POLITENESS 0 unless --politeness is given, and reports
+pages/sec, exact per-page latency percentiles, peak RSS, peak frontier size
+(summed over the processes of --mode processes) and what part of the site
+was fetched. --json saves the numbers and --baseline
+compares against saved ones, exiting with 1 when pages/sec or p99 is more
+than --tolerance worse. '''
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import resource
+import tempfile
+from configparser import ConfigParser
+from argparse import ArgumentParser
+
+from benchmarks.site import SyntheticSite, SiteServer
+from benchmarks.replay import ReplayServer
+from utils.config import Config
+from utils.metrics import metrics
+from utils.robots import robots_cache, RobotsEntry
+from utils.page_cache import page_cache
+from crawler import Crawler, AsyncCrawler, MultiProcessCrawler
+from crawler.store import open_store
+import scraper
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "config.ini")
+
+
+def allow_all(netlocs):
+    # robots.txt is not part of the cache protocol, trust every host.
+    for netloc in netlocs:
+        robots_cache.entries[netloc] = RobotsEntry(
+            time.time() + 24 * 60 * 60, 200, list())
+
+
+def make_config(args, cache_server, seeds):
+    parser = ConfigParser()
+    parser.read(args.config_file)
+    if seeds:
+        parser["CRAWLER"]["SEEDURL"] = ",".join(seeds)
+    parser["CRAWLER"]["POLITENESS"] = str(args.politeness)
+    parser["LOCAL PROPERTIES"]["SAVE"] = "frontier.bench"
+    config = Config(parser)
+    config.mode = args.mode
+    config.threads_count = args.threads
+    config.cache_server = cache_server
+    return config
+
+
+def make_crawler(config):
+    if config.mode == "async":
+        return AsyncCrawler(config, True)
+    if config.mode == "processes":
+        return MultiProcessCrawler(config, True)
+    return Crawler(config, True)
+
+
+def percentile(samples, fraction):
+    ''' Nearest-rank percentile of samples, None if there are none. '''
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[max(1, math.ceil(len(ordered) * fraction)) - 1]
+
+
+def discovered_urls(config, crawler):
+    ''' Urls in the save file, or in every shard's save file. '''
+    frontier = getattr(crawler, "frontier", None)
+    if frontier is not None:
+        return len(frontier.save)
+    discovered = 0
+    for shard in range(config.processes):
+        save = open_store(config.store, f"{config.save_file}.{shard}")
+        discovered += len(save)
+        save.close()
+    return discovered
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux. Shard processes count as children.
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) / 1024
+
+
+def run(args):
+    if args.replay:
+        server = ReplayServer(("127.0.0.1", 0), os.path.abspath(args.replay))
+        allow_all({url.split("/")[2] for url in server.urls()})
+        seeds = None
+    else:
+        site = SyntheticSite(args.hosts, args.pages, args.links, seed=args.seed)
+        server = SiteServer(("127.0.0.1", 0), site, latency=args.latency / 1000)
+        allow_all(f"h{host}.ics.uci.edu" for host in range(args.hosts))
+        seeds = site.seeds()
+    config = make_config(args, server.start(), seeds)
+    metrics.enabled = True
+    # Raw latencies, the histogram buckets hide changes within a bucket.
+    metrics.keep("page")
+
+    workdir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        crawler = make_crawler(config)
+        start = time.perf_counter()
+        crawler.start()
+        elapsed = time.perf_counter() - start
+        discovered = discovered_urls(config, crawler)
+        frontier = getattr(crawler, "frontier", None)
+        if frontier is not None:
+            # Closed while still in workdir, shelve writes relative paths.
+            frontier.save.close()
+            frontier.seen.close()
+            page_cache.close()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+        server.shutdown()
+        server.server_close()
+
+    fetched = sum(server.served.values()) if not args.replay else None
+    pages = len(scraper.crawl_stats.unique_pages)
+    samples, peaks = metrics.export()
+    p50 = percentile(samples["page"], 0.5)
+    p99 = percentile(samples["page"], 0.99)
+    results = {
+        "mode": config.mode,
+        "seconds": elapsed,
+        "unique_pages": pages,
+        "pages_per_second": pages / elapsed,
+        "page_p50": p50,
+        "page_p99": p99,
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_frontier": peaks.get("frontier_depth", 0),
+        "discovered": discovered,
+        "served": dict(server.served) if not args.replay else None,
+        "fetched": fetched,
+        "replay_misses": server.misses if args.replay else None,
+    }
+    return results
+
+
+def format_seconds(seconds):
+    return "n/a" if seconds is None else f"{seconds * 1000:.1f}ms"
+
+
+def report(results):
+    print(f"{results['unique_pages']} unique pages in "
+          f"{results['seconds']:.2f}s ({results['mode']}), "
+          f"{results['pages_per_second']:.1f} pages/s")
+    print(f"per page p50 {format_seconds(results['page_p50'])}, "
+          f"p99 {format_seconds(results['page_p99'])}, "
+          f"peak rss {results['peak_rss_mb']:.0f}MB")
+    if results["discovered"] is not None:
+        print(f"frontier peak {results['peak_frontier']}, "
+              f"{results['discovered']} urls discovered")
+    if results["served"] is not None:
+        served = ", ".join(
+            f"{kind} {count}" for kind, count in sorted(results["served"].items()))
+        print(f"fetched {results['fetched']}: {served}")
+    if results["replay_misses"] is not None:
+        print(f"{results['replay_misses']} urls not in the recording")
+
+
+def compare(results, baseline, tolerance):
+    ''' Print the change from baseline, True when nothing regressed. '''
+    ok = True
+    checks = [("pages_per_second", True), ("page_p99", False)]
+    for key, higher_is_better in checks:
+        old, new = baseline.get(key), results.get(key)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        flag = "REGRESSION" if worse > tolerance else "ok"
+        ok = ok and worse <= tolerance
+        print(f"{key}: {old:.4g} -> {new:.4g} ({change:+.1%}) {flag}")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--config_file", type=str, default=CONFIG_FILE)
+    parser.add_argument("--mode", type=str, default="threads",
+                        choices=["threads", "async", "processes"])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--politeness", type=float, default=0)
+    parser.add_argument("--hosts", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=400,
+                        help="pages per host of the synthetic site")
+    parser.add_argument("--links", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0,
+                        help="milliseconds the server adds to every reply")
+    parser.add_argument("--replay", type=str, default=None,
+                        help="crawl a recording instead of the synthetic site")
+    parser.add_argument("--json", type=str, default=None)
+    parser.add_argument("--baseline", type=str, default=None)
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    results = run(args)
+    report(results)
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(results, output, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            if not compare(results, json.load(baseline), args.tolerance):
+                sys.exit(1)
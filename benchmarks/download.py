@@ -0,0 +1,63 @@
+''' Load test utils.download.download against the local cache server.
+
+    python3 -m benchmarks.download --threads 8 --requests 2000 --error_rate 0.05
+
+Reports throughput, per-request latency percentiles and retries. '''
+import time
+from types import SimpleNamespace
+from threading import Thread
+from argparse import ArgumentParser
+
+from benchmarks.cache_server import CacheServer
+from utils.download import download
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def main(threads, requests_count, latency, error_rate, stall_rate):
+    server = CacheServer(("127.0.0.1", 0), latency / 1000, error_rate,
+                         stall_rate, stall=2)
+    config = SimpleNamespace(
+        cache_server=server.start(), user_agent="IR benchmark",
+        connect_timeout=1, read_timeout=1, retries=3, backoff=0.05)
+    results = list()
+
+    def fetch(worker_id):
+        for i in range(worker_id, requests_count, threads):
+            resp = download(f"https://www.ics.uci.edu/page/{i}", config)
+            results.append(resp)
+
+    start = time.perf_counter()
+    workers = [Thread(target=fetch, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    latencies = [resp.latency for resp in results]
+    failed = sum(resp.status != 200 for resp in results)
+    retried = sum(resp.attempts - 1 for resp in results)
+    print(f"{len(results)} requests in {elapsed:.2f}s, "
+          f"{len(results) / elapsed:.1f} req/s, {failed} failed, "
+          f"{retried} retries")
+    print(f"latency p50 {percentile(latencies, 0.5) * 1000:.1f}ms, "
+          f"p99 {percentile(latencies, 0.99) * 1000:.1f}ms, "
+          f"max {max(latencies) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0,
+                        help="milliseconds the server adds to every reply")
+    parser.add_argument("--error_rate", type=float, default=0)
+    parser.add_argument("--stall_rate", type=float, default=0)
+    args = parser.parse_args()
+    main(args.threads, args.requests, args.latency, args.error_rate,
+         args.stall_rate)
@@ -0,0 +1,77 @@
+''' Record the replies of a real cache server and serve them again offline.
+
+    python3 -m benchmarks.replay --record styx.ics.uci.edu:9000 --file crawl.rec
+    python3 -m benchmarks.replay --file crawl.rec
+
+With --record the server is a proxy: every request is forwarded to the
+real cache server and its reply stored in the recording as is. Without it
+the recorded replies are served back, and urls that were never recorded
+get a 404, so a crawl over the recording follows exactly the pages of the
+recorded one. Point the crawler at it with launch.py --cache_server, or run
+benchmarks.crawl --replay crawl.rec. '''
+from argparse import ArgumentParser
+
+import requests
+
+from benchmarks.cache_server import CacheServer, make_raw_response, encode_reply
+from crawler.store import LogStore
+
+
+class ReplayServer(CacheServer):
+    def __init__(self, address, path, upstream=None, user_agent=None, **kwargs):
+        super().__init__(address, **kwargs)
+        self.recording = LogStore(path)
+        # (host, port) of the cache server to record from.
+        self.upstream = upstream
+        self.user_agent = user_agent
+        self.misses = 0
+
+    def urls(self):
+        return list(self.recording.keys())
+
+    def resolve(self, url):
+        if self.upstream is not None:
+            return self._record(url)
+        reply = self.recording.get(url)
+        if reply is None:
+            self.misses += 1
+            return encode_reply(url, 404, make_raw_response(url, 404, b""))
+        return reply
+
+    def _record(self, url):
+        host, port = self.upstream
+        resp = requests.get(
+            f"http://{host}:{port}/",
+            params=[("q", url), ("u", self.user_agent)], timeout=60)
+        if resp.status_code == 200:
+            self.recording[url] = resp.content
+            self.recording.sync()
+        return resp.content
+
+    def server_close(self):
+        super().server_close()
+        self.recording.close()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--file", type=str, required=True,
+                        help="recording to serve, or to add to with --record")
+    parser.add_argument("--record", type=str, default=None,
+                        help="host:port of the cache server to record")
+    parser.add_argument("--useragent", type=str, default="IR benchmark")
+    args = parser.parse_args()
+    upstream = None
+    if args.record:
+        record_host, record_port = args.record.rsplit(":", 1)
+        upstream = (record_host, int(record_port))
+    server = ReplayServer(
+        (args.host, args.port), args.file, upstream, args.useragent)
+    print(f"{'Recording' if upstream else 'Replaying'} {args.file} "
+          f"({len(server.recording)} replies) on {args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
@@ -0,0 +1,106 @@
+''' Startup time of Frontier resume against the original revalidating load.
+
+    python3 -m benchmarks.resume --sizes 10000 100000 1000000
+
+Each save file holds one url per entry across 500 hosts, half of them
+completed, in the original (url, completed) format. robots.txt is served
+from a pre-filled cache, so the "original" column is a lower bound: the
+original code also fetched robots.txt once per pending url. '''
+import os
+import time
+import shutil
+import tempfile
+from configparser import ConfigParser
+from argparse import ArgumentParser
+
+from crawler.frontier import Frontier
+from crawler.store import open_store
+from utils import get_urlhash
+from utils.config import Config
+from utils.robots import robots_cache, RobotsEntry
+from utils.page_cache import page_cache
+import scraper
+
+HOSTS = 500
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "config.ini")
+
+
+def make_url(i):
+    return f"https://host{i % HOSTS}.ics.uci.edu/page/{i}"
+
+
+def build_save(path, store, size):
+    save = open_store(store, path)
+    for i in range(size):
+        url = make_url(i)
+        save[get_urlhash(url)] = (url, i % 2 == 0)
+    save.sync()
+    save.close()
+    for i in range(HOSTS):
+        robots_cache.entries[f"host{i}.ics.uci.edu"] = RobotsEntry(
+            time.time() + 3600, 200, list())
+
+
+def original_resume(path, store):
+    start = time.perf_counter()
+    save = open_store(store, path)
+    to_be_downloaded = list()
+    for url, completed in save.values():
+        if not completed and scraper.is_valid(url):
+            to_be_downloaded.append(url)
+    save.close()
+    return time.perf_counter() - start
+
+
+def make_config(path, store):
+    # config.ini with the settings the timings depend on pinned.
+    parser = ConfigParser()
+    parser.read(CONFIG_FILE)
+    parser["CRAWLER"]["SEEDURL"] = "https://www.ics.uci.edu"
+    parser["CRAWLER"]["SCHEDULER"] = "host"
+    parser["CRAWLER"]["RATE"] = "fixed"
+    parser["LOCAL PROPERTIES"]["SAVE"] = path
+    parser["LOCAL PROPERTIES"]["STORE"] = store
+    parser["LOCAL PROPERTIES"]["STATS"] = "exact"
+    parser["LOCAL PROPERTIES"]["REPORTEVERY"] = "0"
+    parser["LOCAL PROPERTIES"]["METRICSPORT"] = "0"
+    parser["LOCAL PROPERTIES"]["METRICSINTERVAL"] = "0"
+    return Config(parser)
+
+
+def frontier_resume(path, store):
+    config = make_config(path, store)
+    start = time.perf_counter()
+    frontier = Frontier(config, False)
+    elapsed = time.perf_counter() - start
+    frontier.save.close()
+    frontier.seen.close()
+    page_cache.close()
+    return elapsed
+
+
+def main(sizes, store):
+    workdir = tempfile.mkdtemp()
+    try:
+        print(f"{'entries':>10} {'original':>10} {'first':>10} {'warm':>10}")
+        for size in sizes:
+            path = os.path.join(workdir, f"frontier-{size}.{store}")
+            build_save(path, store, size)
+            original = original_resume(path, store)
+            # First resume stamps every pending url with the rules version,
+            # later ones stream straight into the queue.
+            first = frontier_resume(path, store)
+            warm = frontier_resume(path, store)
+            print(f"{size:>10} {original:>9.2f}s {first:>9.2f}s {warm:>9.2f}s")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[10000, 100000, 1000000])
+    parser.add_argument("--store", type=str, default="shelve")
+    args = parser.parse_args()
+    main(args.sizes, args.store)
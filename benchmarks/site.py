@@ -0,0 +1,144 @@
+''' A synthetic website for offline crawls, served by SiteServer.
+
+Every host hN.ics.uci.edu has pages /page/0 .. /page/<pages - 1>. Page n
+links to its children in a tree of fan-out `links` (so the site is many
+levels deep), to page n + 1 on the same host, and to a random page on
+another host. Some pages also link to:
+
+  /events/<yyyy-mm-dd>     an endless calendar, one day links to the next
+  /a/b/a/b/...             a path that repeats itself one level deeper
+  /page/<n>?sessionid=<x>  a fresh session id on every visit
+  /list?offset=<k>         pagination the url filters do not catch,
+                           TRAP_DEPTH pages long
+  /print/<n>               an exact copy of /page/<n>
+  /mirror/<n>              /page/<n> with a few words changed
+  /gone/<n>                a 404
+
+The first three are infinite, the crawler has to recognise them. Pages are
+generated from the url alone, so every run sees the same site. '''
+import random
+import hashlib
+import datetime
+from threading import Lock
+from urllib.parse import urlparse, parse_qs
+
+from benchmarks.cache_server import CacheServer, make_raw_response, encode_reply
+
+TRAP_DEPTH = 200
+# Fraction of pages linking to each kind of special page.
+TRAP_RATE = 0.05
+DUPLICATE_RATE = 0.1
+MISSING_RATE = 0.02
+
+
+def host_name(host):
+    return f"h{host}.ics.uci.edu"
+
+
+class SyntheticSite(object):
+    def __init__(self, hosts=5, pages=1000, links=4, words=300, seed=0):
+        self.hosts = hosts
+        self.pages = pages
+        self.links = links
+        self.words = words
+        self.seed = seed
+
+    def seeds(self):
+        return [f"https://{host_name(0)}/page/0"]
+
+    def _rand(self, key):
+        digest = hashlib.md5(f"{self.seed}/{key}".encode("utf-8")).hexdigest()
+        return random.Random(int(digest[:8], 16))
+
+    def _body(self, key, changed=0):
+        rand = self._rand(key)
+        words = [f"word{rand.randrange(2000)}" for _ in range(self.words)]
+        for i in range(changed):
+            words[rand.randrange(len(words))] = f"mirror{i}"
+        return " ".join(words)
+
+    def _page_links(self, base, number):
+        rand = self._rand(f"{base}/links/{number}")
+        links = [f"{base}/page/{child}"
+                 for child in range(number * self.links + 1,
+                                    min(number * self.links + self.links + 1,
+                                        self.pages))]
+        if number + 1 < self.pages:
+            links.append(f"{base}/page/{number + 1}")
+        other = host_name(rand.randrange(self.hosts))
+        links.append(f"https://{other}/page/{rand.randrange(self.pages)}")
+        if rand.random() < TRAP_RATE:
+            links.append(f"{base}/events/2020-01-01")
+        if rand.random() < TRAP_RATE:
+            links.append(f"{base}/a/b/")
+        if rand.random() < TRAP_RATE:
+            links.append(f"{base}/page/{number}?sessionid={rand.getrandbits(32):x}")
+        if rand.random() < TRAP_RATE:
+            links.append(f"{base}/list?offset=0")
+        if rand.random() < DUPLICATE_RATE:
+            links.append(f"{base}/print/{number}")
+        if rand.random() < DUPLICATE_RATE:
+            links.append(f"{base}/mirror/{number}")
+        if rand.random() < MISSING_RATE:
+            links.append(f"{base}/gone/{number}")
+        return links
+
+    def render(self, url):
+        ''' (kind, status, html) for url. kind names the part of the site
+            it belongs to: page, trap, duplicate or missing. '''
+        parsed = urlparse(url)
+        base = f"{parsed.scheme}://{parsed.netloc}"
+        parts = parsed.path.strip("/").split("/")
+        query = parse_qs(parsed.query)
+        kind = "page"
+        links = list()
+        if parts[0] in ("page", "print", "mirror") and len(parts) == 2 \
+                and parts[1].isdigit() and int(parts[1]) < self.pages:
+            number = int(parts[1])
+            body = self._body(f"{parsed.netloc}/{number}",
+                              changed=2 if parts[0] == "mirror" else 0)
+            links = self._page_links(base, number)
+            if parts[0] != "page":
+                kind = "duplicate"
+            elif "sessionid" in query:
+                kind = "trap"
+        elif parts[0] == "events" and len(parts) == 2:
+            kind = "trap"
+            try:
+                day = datetime.date.fromisoformat(parts[1])
+            except ValueError:
+                return "missing", 404, b""
+            body = self._body(url)
+            links = [f"{base}/events/{day + datetime.timedelta(days=1)}"]
+        elif parts[0] == "a" and parts[-1] in ("a", "b"):
+            kind = "trap"
+            body = self._body(url)
+            links = [f"{base}{parsed.path.rstrip('/')}/a/b/"]
+        elif parts[0] == "list" and "offset" in query:
+            kind = "trap"
+            offset = int(query["offset"][0])
+            body = self._body(url)
+            if offset + 1 < TRAP_DEPTH:
+                links = [f"{base}/list?offset={offset + 1}"]
+        else:
+            return "missing", 404, b""
+        anchors = "".join(f'<a href="{link}">link</a> ' for link in links)
+        html = (f"<html><head><title>{url}</title></head><body>"
+                f"<p>{body}</p>{anchors}</body></html>")
+        return kind, 200, html.encode("utf-8")
+
+
+class SiteServer(CacheServer):
+    ''' CacheServer answering from a SyntheticSite, counting the requests
+        for each kind of page. '''
+    def __init__(self, address, site, **kwargs):
+        super().__init__(address, **kwargs)
+        self.site = site
+        self.served = dict()
+        self.served_lock = Lock()
+
+    def resolve(self, url):
+        kind, status, content = self.site.render(url)
+        with self.served_lock:
+            self.served[kind] = self.served.get(kind, 0) + 1
+        return encode_reply(url, status, make_raw_response(url, status, content))
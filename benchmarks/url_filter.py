@@ -0,0 +1,159 @@
+''' Parity and speed of utils.url_filter against the original is_valid.
+
+    python3 -m benchmarks.url_filter --corpus links.txt
+    python3 -m benchmarks.url_filter --count 1000000
+
+The corpus is one url per line, for example the outlinks of a real crawl.
+Without one, a synthetic mix of seed-domain pages, traps, foreign hosts and
+binary files is generated, repeating the way page outlinks do. robots.txt is left out of both sides.
+Exits with 1 when any verdict differs from the original. '''
+import re
+import sys
+import time
+import random
+from argparse import ArgumentParser
+from urllib.parse import urlparse, parse_qs
+
+from utils.constants import seed_urls
+from utils.url_filter import UrlFilter
+
+
+def legacy_is_trap(parsed):
+    # The original scraper.is_trap, verbatim.
+    if len(str(parsed.geturl())) > 200:
+        return True, "Long url traps"
+    path_segments = parsed.path.lower().split("/")
+    path_segments = path_segments[1:]
+    REPEATER = re.compile(r"(.+/)\1+")
+    match = REPEATER.findall(f"{parsed.geturl()}/")
+    if(len(match) > 0):
+        return True, "Duplicate Path Trap"
+    if "session" in path_segments or "session" in parsed.query:
+        return True, "Session Trap"
+    if re.match("^.*?(/.+?/).*?\1.*$|^.*?/(.+?/)\2.*$", parsed.path):
+        return True, "Repeating Directories Trap"
+    if re.match("^.*(/misc|/sites|/all|/themes|/modules|/profiles|/css|/field|/node|/theme){3}.*$", parsed.path):
+        return True, "Extra Directories Trap"
+    if parsed is None:
+        return False, ""
+    url_query = parsed.query
+    if url_query != "":
+        query_params = parse_qs(url_query)
+        if len(query_params) > 7:
+            return True, "Dynamic Trap"
+    if re.match(r".*(calendar|date|gallery|image|wp-content|pdf|img_).*?$", parsed.path.lower()):
+        return True, "Club Page Trap"
+    if re.match(r".*\/20\d\d-\d\d*", parsed.path.lower()):
+        return True, "Month Trap"
+    if "/event/" in parsed.path or "/events/" in parsed.path:
+        return True, "Calendar Trap"
+    return False, ""
+
+
+def legacy_is_valid(url):
+    # The original scraper.is_valid without the robots.txt check.
+    parsed = urlparse(url)
+    if parsed.scheme not in set(["http", "https"]):
+        return False, "Https missing"
+    if not any(check_url in url for check_url in seed_urls):
+        return False, "Non-seed-url"
+    trap_bool, trap_reason = legacy_is_trap(parsed)
+    if trap_bool:
+        return False, f"Is a Trap - {trap_reason}"
+    if re.match(
+        r".*\.(css|js|bmp|gif|jpe?g|ico"
+        + r"|png|tiff?|mid|mp2|mp3|mp4"
+        + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
+        + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
+        + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
+        + r"|epub|dll|cnf|tgz|sha1"
+        + r"|thmx|mso|arff|rtf|jar|csv"
+        + r"|rm|smil|wmv|swf|wma|zip|rar|gz)$", parsed.path.lower()):
+        return False, "Re Matching Failed"
+    return True, ""
+
+
+def filter_is_valid(url_filter, url):
+    parsed, reason, trap_reason = url_filter.check(url)
+    if reason:
+        return False, reason
+    if trap_reason:
+        return False, trap_reason
+    return True, ""
+
+
+HOSTS = ["www.ics.uci.edu", "www.cs.uci.edu", "www.informatics.uci.edu",
+         "www.stat.uci.edu", "vision.ics.uci.edu", "wics.ics.uci.edu",
+         "isg.ics.uci.edu", "today.uci.edu", "www.google.com", "evoke.ics.uci.edu"]
+WORDS = ["about", "people", "faculty", "research", "news", "Events", "event",
+         "courses", "~eppstein", "pubs", "misc", "sites", "all", "node",
+         "calendar", "gallery", "2019-05", "session", "wiki", "doku.php",
+         "files", "index.html", "paper.pdf", "data.csv", "img_1.png", "a", "b"]
+
+
+def synthetic_url(rand):
+    host = rand.choice(HOSTS)
+    if host == "today.uci.edu":
+        host = "today.uci.edu/department/information_computer_sciences"
+    segments = [rand.choice(WORDS) for _ in range(rand.randrange(1, 7))]
+    if rand.random() < 0.05:
+        segments = segments + segments
+    url = f"{rand.choice(['https', 'http', 'ftp'])}://{host}/{'/'.join(segments)}"
+    if rand.random() < 0.3:
+        url += "/"
+    if rand.random() < 0.2:
+        url += "?" + "&".join(
+            f"{rand.choice(['id', 'do', 'rev', 'q', 'sessionid', 'p', 'x', 'y', 'z', 'w'])}"
+            f"{rand.randrange(4)}={rand.randrange(100)}"
+            for _ in range(rand.randrange(1, 11)))
+    return url
+
+
+def main(corpus, count):
+    if corpus:
+        with open(corpus) as links:
+            urls = [line.strip() for line in links if line.strip()]
+    else:
+        # Outlinks repeat a lot (menus, footers), so draw skewed from a
+        # pool a tenth the size of the corpus.
+        rand = random.Random(0)
+        pool = [synthetic_url(rand) for _ in range(max(1, count // 10))]
+        urls = [pool[int(len(pool) * rand.random() ** 3)] for _ in range(count)]
+    distinct = len(set(urls))
+    print(f"{len(urls)} urls, {distinct} distinct")
+
+    start = time.perf_counter()
+    expected = [legacy_is_valid(url) for url in urls]
+    legacy = time.perf_counter() - start
+
+    url_filter = UrlFilter(seed_urls, memo_size=0)
+    start = time.perf_counter()
+    uncached = [filter_is_valid(url_filter, url) for url in urls]
+    compiled = time.perf_counter() - start
+
+    url_filter = UrlFilter(seed_urls)
+    start = time.perf_counter()
+    memoized = [filter_is_valid(url_filter, url) for url in urls]
+    cached = time.perf_counter() - start
+
+    mismatches = [
+        (url, old, new) for url, old, new in zip(urls, expected, uncached)
+        if old != new]
+    assert uncached == memoized
+    per_url = 1e6 / len(urls)
+    print(f"original  {legacy:8.2f}s  {legacy * per_url:6.1f}us/url")
+    print(f"compiled  {compiled:8.2f}s  {compiled * per_url:6.1f}us/url")
+    print(f"memoized  {cached:8.2f}s  {cached * per_url:6.1f}us/url")
+    print(f"{len(mismatches)} verdicts differ from the original")
+    for url, old, new in mismatches[:20]:
+        print(f"  {url}: {old} != {new}")
+    return not mismatches
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--corpus", type=str)
+    parser.add_argument("--count", type=int, default=1000000)
+    args = parser.parse_args()
+    if not main(args.corpus, args.count):
+        sys.exit(1)
@@ -1,6 +1,10 @@
 from utils import get_logger
+from utils.canonical import canonicalizer
 from crawler.frontier import Frontier
 from crawler.worker import Worker
+from crawler.aio_crawler import AsyncCrawler
+from crawler.shard_crawler import MultiProcessCrawler
+import scraper
 
 class Crawler(object):
     def __init__(self, config, restart, frontier_factory=Frontier, worker_factory=Worker):
@@ -24,3 +28,7 @@ class Crawler(object):
     def join(self):
         for worker in self.workers:
             worker.join()
+        self.logger.info(canonicalizer.summary())
+        # One report when every worker is done.
+        scraper.crawl_stats.save_checkpoint()
+        scraper.generate_report_txt()
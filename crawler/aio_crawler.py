@@ -0,0 +1,121 @@
+import copy
+import time
+import asyncio
+
+from threading import Thread, Condition
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import get_logger
+from utils.canonical import canonicalizer
+from utils.metrics import metrics
+from utils.aio_download import ConnectionPool, download
+from crawler.frontier import Frontier
+from crawler.worker import count_response
+import scraper
+
+
+class AsyncCrawler(object):
+    ''' Runs CONCURRENCY fetches on one event loop instead of one thread per
+        worker. A feeder thread takes urls from the frontier (which may block
+        on politeness) and hands them to the loop; scraper.scraper and the
+        frontier writes run on a PARSERS-sized thread pool so the loop only
+        does network I/O. Politeness is left to the frontier, so SCHEDULER
+        = stack, where each worker sleeps on its own, runs as host. '''
+    def __init__(self, config, restart, frontier_factory=Frontier):
+        self.logger = get_logger("CRAWLER")
+        if config.scheduler == "stack":
+            # CONCURRENCY sleeping fetches would still hit one host at once.
+            self.logger.warning(
+                "SCHEDULER stack can not keep POLITENESS in async mode, "
+                "using host.")
+            config = copy.copy(config)
+            config.scheduler = "host"
+        self.config = config
+        self.frontier = frontier_factory(config, restart)
+        self.inflight = 0
+        self.idle = Condition()
+
+    def start(self):
+        asyncio.run(self._crawl())
+        self.logger.info(canonicalizer.summary())
+        scraper.crawl_stats.save_checkpoint()
+        scraper.generate_report_txt()
+
+    async def _crawl(self):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        host, port = self.config.cache_server
+        pool = ConnectionPool(host, port, self.config.concurrency)
+        parsers = ThreadPoolExecutor(self.config.parse_workers)
+        feeder = Thread(target=self._feed, args=(loop, queue), daemon=True)
+        feeder.start()
+        try:
+            await asyncio.gather(*[
+                self._fetch_loop(fetcher_id, queue, pool, parsers)
+                for fetcher_id in range(self.config.concurrency)])
+        finally:
+            pool.close()
+            parsers.shutdown()
+        self.logger.info("Frontier is empty. Stopping Crawler.")
+
+    def _feed(self, loop, queue):
+        while True:
+            with self.idle:
+                while self.inflight >= self.config.concurrency:
+                    self.idle.wait()
+                self.inflight += 1
+            tbd_url = self.frontier.get_tbd_url()
+            if tbd_url:
+                loop.call_soon_threadsafe(queue.put_nowait, tbd_url)
+                continue
+            with self.idle:
+                self.inflight -= 1
+                if not self.inflight:
+                    break
+                # Pages still being scraped may add more urls.
+                self.idle.wait()
+        for _ in range(self.config.concurrency):
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+
+    async def _fetch_loop(self, fetcher_id, queue, pool, parsers):
+        loop = asyncio.get_running_loop()
+        while True:
+            tbd_url = await queue.get()
+            if tbd_url is None:
+                break
+            started = time.perf_counter()
+            # _process marks the url done, whatever happens in it.
+            processing = False
+            try:
+                with metrics.timer("download"):
+                    resp = await download(tbd_url, self.config, pool, self.logger)
+                count_response(resp)
+                self.frontier.rate.observe(tbd_url, resp)
+                self.logger.info(
+                    f"Downloaded {tbd_url}, status <{resp.status}>, "
+                    f"in {resp.latency:.3f}s, "
+                    f"using cache {self.config.cache_server}.")
+                processing = True
+                await loop.run_in_executor(parsers, self._process, tbd_url, resp)
+                metrics.observe("page", time.perf_counter() - started)
+            except Exception:
+                # One bad page must not take the other fetches down with it.
+                metrics.inc("errors_total", status="exception")
+                self.logger.exception(f"Failed to crawl {tbd_url}.")
+            finally:
+                if not processing:
+                    # Or the scheduler would wait for this url forever.
+                    await loop.run_in_executor(
+                        parsers, self.frontier.add_urls, [], tbd_url)
+                with self.idle:
+                    self.inflight -= 1
+                    self.idle.notify()
+
+    def _process(self, tbd_url, resp):
+        scraped_urls = list()
+        try:
+            with metrics.timer("scrape"):
+                scraped_urls = scraper.scraper(tbd_url, resp)
+        finally:
+            with metrics.timer("frontier"):
+                self.frontier.add_urls(scraped_urls, tbd_url)
@@ -1,17 +1,42 @@
 import os
-import shelve
+import glob
 
 from threading import Thread, RLock
 from queue import Queue, Empty
 
-from utils import get_logger, get_urlhash, normalize
-from scraper import is_valid
+from utils import get_logger, get_urlhash, set_log_rate
+from utils.canonical import canonicalizer
+from utils.templates import template_budget
+from utils.response import Response
+from utils.robots import robots_cache
+from utils.metrics import metrics
+from scraper import is_valid, rules_version, crawl_stats
+from crawler.scheduler import get_scheduler
+from crawler.rate import get_rate
+from crawler.store import open_store
+from crawler.seen import SeenSet
+from utils.page_cache import page_cache
+
+def unpack_entry(value):
+    ''' Save entries are (url, completed, valid, rules version, depth).
+        Entries written before verdicts were stored are (url, completed),
+        the ones from before depths (url, completed, valid, rules). '''
+    if len(value) == 2:
+        url, completed = value
+        return url, completed, True, None, 0
+    if len(value) == 4:
+        return (*value, 0)
+    return value
 
 class Frontier(object):
     def __init__(self, config, restart):
         self.logger = get_logger("FRONTIER")
         self.config = config
-        self.to_be_downloaded = list()
+        # Seconds to wait between fetches, per host.
+        self.rate = get_rate(config)
+        self.to_be_downloaded = get_scheduler(config, self.rate)
+        self.lock = RLock()
+        self.rules = rules_version()
         
         if not os.path.exists(self.config.save_file) and not restart:
             # Save file does not exist, but request to load save.
@@ -23,50 +48,142 @@ class Frontier(object):
             self.logger.info(
                 f"Found save file {self.config.save_file}, deleting it.")
             os.remove(self.config.save_file)
+        # robots.txt verdicts are kept next to the save file.
+        robots_cache.attach(f"{self.config.save_file}.robots", restart)
+        if restart:
+            # dbm may add its own extensions to the page cache's name.
+            for path in [f"{self.config.save_file}.seen",
+                         *glob.glob(f"{glob.escape(self.config.save_file)}.pages*")]:
+                if os.path.exists(path):
+                    os.remove(path)
+        # So are the spill file for word counts and the stats checkpoint.
+        # A refresh counts every page again, from empty statistics.
+        crawl_stats.configure(self.config)
+        if ((restart or self.config.refresh)
+                and os.path.exists(crawl_stats.checkpoint_path)):
+            os.remove(crawl_stats.checkpoint_path)
+        elif crawl_stats.load_checkpoint():
+            self.logger.info(
+                f"Resumed crawl statistics from {crawl_stats.checkpoint_path}.")
+        metrics.configure(self.config, self.logger)
+        canonicalizer.configure(self.config)
+        Response.configure(self.config)
+        # Template counts and caps, saved with every stats checkpoint.
+        template_budget.configure(self.config, restart)
+        if template_budget.save not in crawl_stats.on_checkpoint:
+            crawl_stats.on_checkpoint.append(template_budget.save)
+        metrics.gauge("templates_capped", lambda: len(template_budget.capped))
+        set_log_rate("invalid", self.config.invalid_log_rate)
+        metrics.gauge("frontier_depth", lambda: len(self.to_be_downloaded))
+        metrics.gauge("frontier_host_depth", self.to_be_downloaded.depths)
+        metrics.gauge("frontier_in_flight", lambda: len(self.to_be_downloaded.busy))
+        metrics.gauge("host_delay", self.rate.delays)
+        metrics.gauge("canonical_saved_fetches", lambda: canonicalizer.saved)
         # Load existing save file, or create one if it does not exist.
-        self.save = shelve.open(self.config.save_file)
+        self.save = open_store(self.config.store, self.config.save_file)
+        # urlhashes of every url in the save file, checked before the store.
+        self.seen = SeenSet(f"{self.config.save_file}.seen", len(self.save))
+        # What each downloaded page looked like, unchanged ones skip parsing.
+        # Always a shelve: the log store keeps every value in memory.
+        page_cache.attach(open_store("shelve", f"{self.config.save_file}.pages"))
         if restart:
-            for url in self.config.seed_urls:
-                self.add_url(url)
+            self.add_urls(self.config.seed_urls)
         else:
             # Set the frontier state with contents of save file.
             self._parse_save_file()
             if not self.save:
-                for url in self.config.seed_urls:
-                    self.add_url(url)
+                self.add_urls(self.config.seed_urls)
 
     def _parse_save_file(self):
         ''' This function can be overridden for alternate saving techniques. '''
         total_count = len(self.save)
         tbd_count = 0
-        for url, completed in self.save.values():
-            if not completed and is_valid(url):
-                self.to_be_downloaded.append(url)
-                tbd_count += 1
+        verdicts = dict()
+        with self.lock:
+            for urlhash, value in self.save.items():
+                url, completed, valid, rules, depth = unpack_entry(value)
+                if not self.seen.trusted:
+                    self.seen.add(urlhash)
+                if completed and not self.config.refresh:
+                    continue
+                if rules != self.rules:
+                    # Only urls saved under older filter rules are checked.
+                    valid = is_valid(url)[0]
+                    verdicts[urlhash] = (url, completed, valid, self.rules, depth)
+                if valid and self.to_be_downloaded.push(url, depth):
+                    tbd_count += 1
+            # Written after the scan, dbm files must not change while iterated.
+            for urlhash, value in verdicts.items():
+                self.save[urlhash] = value
+            if verdicts:
+                self.save.sync()
         self.logger.info(
             f"Found {tbd_count} urls to be downloaded from {total_count} "
-            f"total urls discovered.")
+            f"total urls discovered, revalidated {len(verdicts)}, "
+            f"{'reused' if self.seen.trusted else 'rebuilt'} the seen set.")
 
     def get_tbd_url(self):
-        try:
-            return self.to_be_downloaded.pop()
-        except IndexError:
-            return None
+        # Not under self.lock: the host scheduler may block here until a
+        # host is past its politeness delay.
+        while True:
+            tbd_url = self.to_be_downloaded.pop()
+            if not tbd_url or not template_budget.is_capped(tbd_url):
+                return tbd_url
+            # Queued before its template was capped, dropped as if crawled.
+            self.add_urls((), tbd_url)
+
+    def depth_of(self, url):
+        ''' Links from the seeds to url, 0 if it is not in the save file. '''
+        value = self.save.get(get_urlhash(url))
+        return unpack_entry(value)[4] if value is not None else 0
+
+    def add_urls(self, urls, completed=None, depth=None):
+        ''' Queue the new urls among urls and, if given, mark completed as
+            downloaded, under one lock and with one sync. The urls are
+            depth links from the seeds, by default one more than completed.
+            Urls of a host whose queue is full are left out of the save,
+            so a later link can queue them. Returns the urls that were new
+            and queued. '''
+        batch = {canonicalizer.canonical(url): None for url in urls}
+        hashed = [(get_urlhash(url), url) for url in batch]
+        new_urls = list()
+        with self.lock:
+            parent_depth = -1
+            if completed is not None:
+                urlhash = get_urlhash(completed)
+                if self.seen.add(urlhash):
+                    # This should not happen.
+                    self.logger.error(
+                        f"Completed url {completed}, but have not seen it before.")
+                parent_depth = self.depth_of(completed)
+                self.save[urlhash] = (
+                    completed, True, True, self.rules, parent_depth)
+            if depth is None:
+                depth = parent_depth + 1
+            for urlhash, url in hashed:
+                if urlhash in self.seen:
+                    continue
+                if self.to_be_downloaded.full(url):
+                    metrics.inc("dropped_total")
+                    continue
+                self.seen.add(urlhash)
+                self.save[urlhash] = (url, False, True, self.rules, depth)
+                new_urls.append(url)
+            if new_urls or completed is not None:
+                with metrics.timer("sync"):
+                    self.save.sync()
+        # A host can fill up between the check above and its push.
+        queued = [url for url in new_urls
+                  if self.to_be_downloaded.push(url, depth)]
+        if queued:
+            metrics.peak("frontier_depth", len(self.to_be_downloaded))
+        if completed is not None:
+            self.to_be_downloaded.done(completed)
+        return queued
 
     def add_url(self, url):
-        url = normalize(url)
-        urlhash = get_urlhash(url)
-        if urlhash not in self.save:
-            self.save[urlhash] = (url, False)
-            self.save.sync()
-            self.to_be_downloaded.append(url)
-    
-    def mark_url_complete(self, url):
-        urlhash = get_urlhash(url)
-        if urlhash not in self.save:
-            # This should not happen.
-            self.logger.error(
-                f"Completed url {url}, but have not seen it before.")
+        ''' Returns True if url was new and is now queued. '''
+        return bool(self.add_urls((url,)))
 
-        self.save[urlhash] = (url, True)
-        self.save.sync()
+    def mark_url_complete(self, url):
+        self.add_urls((), url)
@@ -0,0 +1,99 @@
+from threading import Lock
+from urllib.parse import urlparse
+
+from utils.robots import robots_cache
+
+# Weight of the newest response in a host's average latency.
+LATENCY_WEIGHT = 0.3
+# A healthy host waits this many times its average response time, so slow
+# hosts are never asked for more than a fraction of their capacity.
+LATENCY_FACTOR = 2
+# Step towards a lower delay after each healthy response.
+SPEEDUP = 0.8
+# Delay multiplier after a 5xx, cache error or failed connection.
+SLOWDOWN = 2
+
+
+class HostRate(object):
+    def __init__(self, delay):
+        self.delay = delay
+        self.latency = None
+
+
+class FixedRate(object):
+    ''' POLITENESS seconds between fetches from every host. '''
+    def __init__(self, config):
+        self.floor = config.time_delay
+
+    def observe(self, url, resp):
+        pass
+
+    def delay(self, url):
+        return self.floor
+
+    def delays(self):
+        return dict()
+
+
+class AdaptiveRate(object):
+    ''' Per-host delay between fetches. It never goes under POLITENESS or
+        the host's robots.txt Crawl-delay. A host that answers without
+        errors moves towards LATENCY_FACTOR times its average response
+        time; one that fails doubles its delay, up to MAXDELAY. '''
+    def __init__(self, config):
+        self.floor = config.time_delay
+        self.ceiling = max(config.max_delay, self.floor)
+        self.hosts = dict()
+        self.lock = Lock()
+
+    def _lowest(self, parsed):
+        # Cached robots.txt only, observe() runs on the asyncio loop too.
+        crawl_delay = robots_cache.crawl_delay(parsed.netloc, fetch=False)
+        return max(self.floor, float(crawl_delay or 0))
+
+    def observe(self, url, resp):
+        ''' Account one download of url. '''
+        parsed = urlparse(url)
+        lowest = min(self._lowest(parsed), self.ceiling)
+        failed = resp.status is None or resp.status >= 500
+        host = parsed.netloc.lower()
+        with self.lock:
+            rate = self.hosts.get(host)
+            if rate is None:
+                rate = self.hosts[host] = HostRate(lowest)
+            if failed:
+                rate.delay = min(self.ceiling, max(rate.delay, lowest) * SLOWDOWN)
+                return
+            if resp.latency is not None:
+                if rate.latency is None:
+                    rate.latency = resp.latency
+                else:
+                    rate.latency += LATENCY_WEIGHT * (resp.latency - rate.latency)
+            target = min(self.ceiling,
+                         max(lowest, LATENCY_FACTOR * (rate.latency or 0)))
+            rate.delay = max(target, rate.delay * SPEEDUP)
+
+    def delay(self, url):
+        ''' Seconds to wait after a fetch from url's host. '''
+        with self.lock:
+            rate = self.hosts.get(urlparse(url).netloc.lower())
+            if rate is not None:
+                return rate.delay
+        return self.floor
+
+    def delays(self):
+        with self.lock:
+            return {host: rate.delay for host, rate in self.hosts.items()}
+
+
+RATES = {
+    "fixed": FixedRate,
+    "adaptive": AdaptiveRate,
+}
+
+
+def get_rate(config):
+    if config.rate not in RATES:
+        raise ValueError(f"Unknown RATE {config.rate!r}, "
+                         f"expected one of {sorted(RATES)}.")
+    return RATES[config.rate](config)
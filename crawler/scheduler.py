@@ -0,0 +1,342 @@
+import math
+import time
+import heapq
+
+from itertools import count
+from collections import deque, Counter
+from threading import Condition
+from urllib.parse import urlparse
+
+from utils.metrics import metrics
+from utils.templates import url_template
+
+
+def get_host(url):
+    return urlparse(url).netloc.lower()
+
+
+class StackScheduler(object):
+    ''' The original frontier order: one flat LIFO list for every host.
+        Politeness is left to the worker, which sleeps after each page.
+        Popped urls are in flight until done(), and an empty list only ends
+        the crawl once none are: their pages may still add links. '''
+    def __init__(self, config, rate):
+        self.urls = list()
+        self.busy = set()
+        self.cond = Condition()
+
+    def __len__(self):
+        return len(self.urls)
+
+    def full(self, url):
+        return False
+
+    def push(self, url, depth=0):
+        ''' Returns True, every url is queued. '''
+        with self.cond:
+            self.urls.append(url)
+            self.cond.notify()
+        return True
+
+    def pop(self):
+        ''' Block until a url is queued and return it. Returns None only
+            when nothing is queued or in flight. '''
+        with self.cond:
+            while not self.urls:
+                if not self.busy:
+                    return None
+                self.cond.wait()
+            url = self.urls.pop()
+            self.busy.add(url)
+            return url
+
+    def done(self, url):
+        with self.cond:
+            if url not in self.busy:
+                return
+            self.busy.discard(url)
+            if not self.busy and not self.urls:
+                # Workers waiting on an empty frontier can stop.
+                self.cond.notify_all()
+
+    def depths(self):
+        ''' Number of queued urls per host. '''
+        with self.cond:
+            urls = list(self.urls)
+        return Counter(get_host(url) for url in urls)
+
+
+class HostScheduler(object):
+    ''' Per-host queues with a heap of the time each host is next allowed
+        to be fetched. A host is taken off the heap while one of its urls is
+        in flight, and goes back the rate controller's delay for the host
+        after it is marked done, so no two workers ever hit the same host
+        closer than that. '''
+    def __init__(self, config, rate):
+        self.rate = rate
+        self.queues = dict()
+        self.ready = list()
+        self.scheduled = set()
+        self.busy = set()
+        self.available = dict()
+        self.count = 0
+        self.cond = Condition()
+
+    def __len__(self):
+        return self.count
+
+    def _schedule(self, host):
+        # Caller holds self.cond.
+        if host in self.busy or host in self.scheduled or not self.queues.get(host):
+            return
+        heapq.heappush(self.ready, (self.available.get(host, 0), host))
+        self.scheduled.add(host)
+        self.cond.notify()
+
+    def full(self, url):
+        return False
+
+    def push(self, url, depth=0):
+        ''' Returns True, every url is queued. '''
+        host = get_host(url)
+        with self.cond:
+            self.queues.setdefault(host, deque()).append(url)
+            self.count += 1
+            self._schedule(host)
+        return True
+
+    def pop(self):
+        ''' Block until some host is past its delay and return one of its
+            urls. Returns None only when nothing is queued or in flight. '''
+        with self.cond:
+            while True:
+                if self.ready:
+                    ready_time, host = self.ready[0]
+                    wait = ready_time - time.monotonic()
+                    if wait <= 0:
+                        heapq.heappop(self.ready)
+                        self.scheduled.discard(host)
+                        self.busy.add(host)
+                        self.count -= 1
+                        return self.queues[host].pop()
+                    self.cond.wait(wait)
+                elif self.count or self.busy:
+                    # Urls are queued behind busy hosts, or a page in flight
+                    # may still add some.
+                    self.cond.wait()
+                else:
+                    return None
+
+    def done(self, url):
+        host = get_host(url)
+        with self.cond:
+            if host not in self.busy:
+                return
+            self.busy.discard(host)
+            self.available[host] = time.monotonic() + self.rate.delay(url)
+            if self.queues.get(host):
+                self._schedule(host)
+            else:
+                self.queues.pop(host, None)
+            # Workers waiting on an empty frontier may now be able to stop.
+            self.cond.notify_all()
+
+    def depths(self):
+        ''' Number of queued urls per host. '''
+        with self.cond:
+            return {host: len(queue) for host, queue in self.queues.items()
+                    if queue}
+
+
+class DepthScore(object):
+    ''' Breadth first: fewer links from a seed goes first. '''
+    def url(self, url, depth):
+        return depth
+
+    def host(self, host):
+        return 0
+
+    def crawled(self, url):
+        pass
+
+
+class HostScore(object):
+    ''' Hosts with fewer pages crawled so far go first. '''
+    def __init__(self):
+        self.pages = Counter()
+
+    def url(self, url, depth):
+        return 0
+
+    def host(self, host):
+        return math.log2(1 + self.pages[host])
+
+    def crawled(self, url):
+        self.pages[get_host(url)] += 1
+
+
+class NoveltyScore(object):
+    ''' Urls whose pattern was queued fewer times before go first, so a
+        calendar or listing template sinks as its copies pile up. '''
+    def __init__(self):
+        self.patterns = Counter()
+
+    def url(self, url, depth):
+        pattern = url_template(url)
+        seen = self.patterns[pattern]
+        self.patterns[pattern] = seen + 1
+        return math.log2(1 + seen)
+
+    def host(self, host):
+        return 0
+
+    def crawled(self, url):
+        pass
+
+
+SCORERS = {
+    "depth": DepthScore,
+    "host": HostScore,
+    "novelty": NoveltyScore,
+}
+
+
+def get_scorers(config):
+    scorers = list()
+    for name in config.priority:
+        if name not in SCORERS:
+            raise ValueError(f"Unknown PRIORITY {name!r}, "
+                             f"expected some of {sorted(SCORERS)}.")
+        scorers.append(SCORERS[name]())
+    return scorers
+
+
+class PriorityScheduler(object):
+    ''' Per-host heaps of urls, lowest score first, where the score is the
+        sum of the PRIORITY scorers. Hosts are cooled down like in
+        HostScheduler; of the hosts that are ready, the one whose best url
+        scores lowest (plus the scorers' opinion of the host) goes next.
+        Hosts holding MAXHOSTQUEUE urls drop new ones. '''
+    def __init__(self, config, rate):
+        self.rate = rate
+        self.scorers = get_scorers(config)
+        self.max_queue = config.max_host_queue
+        self.queues = dict()
+        # (ready time, host) of hosts cooling down.
+        self.waiting = list()
+        # (key, seq, host) of hosts ready to go, keys[host] is the live key.
+        self.eligible = list()
+        self.keys = dict()
+        self.scheduled = set()
+        self.busy = set()
+        self.available = dict()
+        self.count = 0
+        self.seq = count()
+        self.cond = Condition()
+
+    def __len__(self):
+        return self.count
+
+    def _make_eligible(self, host):
+        # Caller holds self.cond.
+        key = self.queues[host][0][0] + sum(
+            scorer.host(host) for scorer in self.scorers)
+        self.keys[host] = key
+        heapq.heappush(self.eligible, (key, next(self.seq), host))
+
+    def _schedule(self, host):
+        # Caller holds self.cond.
+        if host in self.busy or host in self.scheduled or not self.queues.get(host):
+            return
+        ready_time = self.available.get(host, 0)
+        if ready_time <= time.monotonic():
+            self._make_eligible(host)
+        else:
+            heapq.heappush(self.waiting, (ready_time, host))
+        self.scheduled.add(host)
+        self.cond.notify()
+
+    def full(self, url):
+        ''' Whether url's host already holds MAXHOSTQUEUE urls. '''
+        if not self.max_queue:
+            return False
+        with self.cond:
+            return len(self.queues.get(get_host(url), ())) >= self.max_queue
+
+    def push(self, url, depth=0):
+        ''' Returns False if url was dropped, see full(). '''
+        host = get_host(url)
+        with self.cond:
+            queue = self.queues.setdefault(host, list())
+            if self.max_queue and len(queue) >= self.max_queue:
+                metrics.inc("dropped_total")
+                return False
+            score = sum(scorer.url(url, depth) for scorer in self.scorers)
+            heapq.heappush(queue, (score, next(self.seq), url))
+            self.count += 1
+            if host in self.keys and queue[0][2] == url:
+                # The host's best url changed, the old key goes stale.
+                self._make_eligible(host)
+            self._schedule(host)
+        return True
+
+    def pop(self):
+        ''' Block until some host is past its delay and return the best url
+            of the best such host. Returns None only when nothing is queued
+            or in flight. '''
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                while self.waiting and self.waiting[0][0] <= now:
+                    _, host = heapq.heappop(self.waiting)
+                    self._make_eligible(host)
+                while self.eligible:
+                    key, _, host = heapq.heappop(self.eligible)
+                    if self.keys.get(host) != key:
+                        continue
+                    del self.keys[host]
+                    self.scheduled.discard(host)
+                    self.busy.add(host)
+                    self.count -= 1
+                    return heapq.heappop(self.queues[host])[2]
+                if self.waiting:
+                    self.cond.wait(self.waiting[0][0] - now)
+                elif self.count or self.busy:
+                    self.cond.wait()
+                else:
+                    return None
+
+    def done(self, url):
+        host = get_host(url)
+        with self.cond:
+            if host not in self.busy:
+                return
+            self.busy.discard(host)
+            for scorer in self.scorers:
+                scorer.crawled(url)
+            self.available[host] = time.monotonic() + self.rate.delay(url)
+            if self.queues.get(host):
+                self._schedule(host)
+            else:
+                self.queues.pop(host, None)
+            self.cond.notify_all()
+
+    def depths(self):
+        ''' Number of queued urls per host. '''
+        with self.cond:
+            return {host: len(queue) for host, queue in self.queues.items()
+                    if queue}
+
+
+SCHEDULERS = {
+    "stack": StackScheduler,
+    "host": HostScheduler,
+    "priority": PriorityScheduler,
+}
+
+
+def get_scheduler(config, rate):
+    if config.scheduler not in SCHEDULERS:
+        raise ValueError(f"Unknown SCHEDULER {config.scheduler!r}, "
+                         f"expected one of {sorted(SCHEDULERS)}.")
+    return SCHEDULERS[config.scheduler](config, rate)
@@ -0,0 +1,122 @@
+import os
+import mmap
+import atexit
+import struct
+
+MAGIC = b"SEENSET1"
+# magic, count, capacity, clean, padded so the slots start 8 byte aligned.
+HEADER = struct.Struct("<8sQQQ")
+INITIAL_CAPACITY = 1 << 16
+# Grown to twice the slots past this load, so a url costs 10 to 20 bytes.
+MAX_LOAD = 0.8
+
+
+def url_key(urlhash):
+    ''' 8 byte key of a get_urlhash digest. 0 marks an empty slot. '''
+    return int(urlhash[:16], 16) or 1
+
+
+class SeenSet(object):
+    ''' Every urlhash the frontier has seen, as 8 byte keys in an open
+        addressing table that lives in an mmapped file. Reopening it costs
+        no parsing; the file is only trusted when it was closed cleanly and
+        holds as many urls as the save file, otherwise reset() is called
+        and the frontier re-adds what is in the save. Callers hold the
+        frontier lock. '''
+    def __init__(self, path, expected=None):
+        self.path = path
+        self.file = None
+        self.map = None
+        self.slots = None
+        self.trusted = False
+        if os.path.exists(path) and os.path.getsize(path) > HEADER.size:
+            self._open()
+            magic, count, capacity, clean = HEADER.unpack_from(self.map)
+            self.trusted = bool(magic == MAGIC and clean
+                                and (expected is None or count == expected))
+        if not self.trusted:
+            self.reset()
+        self._set_clean(False)
+        atexit.register(self.close)
+
+    def _open(self):
+        self.file = open(self.path, "r+b")
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        self.count, self.capacity = HEADER.unpack_from(self.map)[1:3]
+        self.slots = memoryview(self.map)[HEADER.size:].cast("Q")
+
+    def _release(self):
+        if self.map is not None:
+            self.slots.release()
+            self.map.close()
+            self.file.close()
+            self.slots = self.map = self.file = None
+
+    def _create(self, path, capacity):
+        with open(path, "wb") as new:
+            new.write(HEADER.pack(MAGIC, 0, capacity, 0))
+            new.truncate(HEADER.size + 8 * capacity)
+
+    def reset(self, capacity=INITIAL_CAPACITY):
+        self._release()
+        self._create(self.path, capacity)
+        self._open()
+
+    def _set_clean(self, clean):
+        HEADER.pack_into(self.map, 0, MAGIC, self.count, self.capacity, clean)
+
+    def __len__(self):
+        return self.count
+
+    def _find(self, key):
+        # Slot holding key, or the empty slot where it would go.
+        mask = self.capacity - 1
+        slot = key & mask
+        slots = self.slots
+        while True:
+            current = slots[slot]
+            if current == key or current == 0:
+                return slot
+            slot = (slot + 1) & mask
+
+    def __contains__(self, urlhash):
+        key = url_key(urlhash)
+        return self.slots[self._find(key)] == key
+
+    def add(self, urlhash):
+        ''' Returns True if urlhash was not in the set yet. '''
+        key = url_key(urlhash)
+        slot = self._find(key)
+        if self.slots[slot] == key:
+            return False
+        self.slots[slot] = key
+        self.count += 1
+        if self.count > MAX_LOAD * self.capacity:
+            self._grow()
+        return True
+
+    def _grow(self):
+        keys = [key for key in self.slots if key]
+        tmp = f"{self.path}.grow"
+        self._release()
+        self._create(tmp, self.capacity * 2)
+        os.replace(tmp, self.path)
+        self._open()
+        mask = self.capacity - 1
+        slots = self.slots
+        for key in keys:
+            slot = key & mask
+            while slots[slot]:
+                slot = (slot + 1) & mask
+            slots[slot] = key
+        self.count = len(keys)
+
+    def bytes_per_url(self):
+        return 8 * self.capacity / max(self.count, 1)
+
+    def close(self):
+        if self.map is None:
+            return
+        self._set_clean(True)
+        self.map.flush()
+        self._release()
@@ -0,0 +1,230 @@
+import copy
+import time
+import queue
+import multiprocessing
+
+from threading import Thread, Lock
+from urllib.parse import urlparse
+
+from utils import get_logger, get_urlhash, stop_queue_loggers
+from utils.canonical import canonicalizer
+from utils.metrics import metrics
+from utils.page_cache import page_cache
+from crawler.frontier import Frontier
+from crawler.worker import Worker
+import scraper
+
+# Urls for another shard are sent once a page is done, or earlier when this
+# many are waiting.
+ROUTE_BATCH = 256
+# Seconds an idle worker waits before checking for urls from other shards.
+IDLE_WAIT = 0.2
+# Seconds the parent waits for a result before checking for dead processes.
+RESULT_WAIT = 1
+
+
+def get_shard(url, shards):
+    ''' The shard that owns url's host, from the get_urlhash of the host. '''
+    parsed = urlparse(url)
+    host = f"{parsed.scheme}://{parsed.netloc.lower()}"
+    return int(get_urlhash(host)[:8], 16) % shards
+
+
+class ShardFrontier(Frontier):
+    ''' Frontier for the hosts of one shard. Urls of other hosts are sent in
+        batches to the owning process. outstanding is shared by all shards
+        and counts urls queued, being crawled or in transit anywhere, so a
+        shard only reports the end of the crawl when every shard is done.
+        Once stop is set, because a shard failed, no more urls are handed
+        out and the rest stay in the save files for the next run. '''
+    def __init__(self, config, restart, shard, inboxes, outstanding, stop):
+        self.shard = shard
+        self.inboxes = inboxes
+        self.outstanding = outstanding
+        self.stop = stop
+        self.outboxes = [list() for _ in inboxes]
+        self.route_lock = Lock()
+        super().__init__(config, restart)
+        # Seeds owned by other shards.
+        self.flush()
+        self.receiver = Thread(target=self._receive, daemon=True)
+        self.receiver.start()
+
+    def _count(self, change):
+        with self.outstanding.get_lock():
+            self.outstanding.value += change
+
+    def _parse_save_file(self):
+        super()._parse_save_file()
+        self._count(len(self.to_be_downloaded))
+
+    def add_urls(self, urls, completed=None, depth=None):
+        if depth is None:
+            depth = 0
+            if completed is not None:
+                with self.lock:
+                    depth = self.depth_of(completed) + 1
+        local = list()
+        with self.route_lock:
+            for url in urls:
+                url = canonicalizer.canonical(url)
+                owner = get_shard(url, len(self.inboxes))
+                if owner == self.shard:
+                    local.append(url)
+                    continue
+                self.outboxes[owner].append((url, depth))
+                if len(self.outboxes[owner]) >= ROUTE_BATCH:
+                    self._send(owner)
+            if completed is not None:
+                # Links found on the page leave before the page stops
+                # counting.
+                for owner in range(len(self.outboxes)):
+                    self._send(owner)
+        # Counted before they are queued, so a worker can not finish one
+        # of them before it counts.
+        self._count(len(local))
+        added = super().add_urls(local, completed, depth)
+        self._count(len(added) - len(local) - (completed is not None))
+        return added
+
+    def _send(self, owner):
+        # Caller holds self.route_lock. Counted before it leaves, so the
+        # batch is never missing from outstanding.
+        batch = self.outboxes[owner]
+        if batch:
+            self._count(len(batch))
+            self.inboxes[owner].put(batch)
+            self.outboxes[owner] = list()
+
+    def flush(self):
+        with self.route_lock:
+            for owner in range(len(self.outboxes)):
+                self._send(owner)
+
+    def get_tbd_url(self):
+        while True:
+            if self.stop.is_set():
+                return None
+            tbd_url = super().get_tbd_url()
+            if tbd_url:
+                return tbd_url
+            if self.outstanding.value <= 0:
+                return None
+            time.sleep(IDLE_WAIT)
+
+    def _receive(self):
+        inbox = self.inboxes[self.shard]
+        while True:
+            batch = inbox.get()
+            if batch is None:
+                break
+            by_depth = dict()
+            for url, depth in batch:
+                by_depth.setdefault(depth, list()).append(url)
+            # The batch still counts as in transit while it is queued.
+            added = 0
+            for depth, urls in by_depth.items():
+                added += len(Frontier.add_urls(self, urls, depth=depth))
+            self._count(added - len(batch))
+
+
+def run_shard(config, restart, shard, inboxes, outstanding, stop, results):
+    ''' Crawl one shard. Always puts (shard, statistics, metrics.export())
+        in results, with None for the statistics and stop set if the shard
+        failed. '''
+    config = copy.copy(config)
+    config.save_file = f"{config.save_file}.{shard}"
+    if config.metrics_port:
+        config.metrics_port += shard
+    released = False
+    snapshot = None
+    try:
+        frontier = ShardFrontier(
+            config, restart, shard, inboxes, outstanding, stop)
+        # This shard is set up, release the startup count held for it.
+        with outstanding.get_lock():
+            outstanding.value -= 1
+        released = True
+        workers = [
+            Worker(f"{shard}-{worker_id}", config, frontier)
+            for worker_id in range(config.threads_count)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        inboxes[shard].put(None)
+        frontier.receiver.join()
+        frontier.logger.info(canonicalizer.summary())
+        frontier.save.close()
+        frontier.seen.close()
+        page_cache.close()
+        scraper.crawl_stats.save_checkpoint()
+        snapshot = scraper.crawl_stats.snapshot()
+    except Exception:
+        get_logger("CRAWLER").exception(f"Crawl process {shard} failed.")
+    finally:
+        if snapshot is None:
+            # The other shards stop handing out urls instead of waiting
+            # for this one's.
+            stop.set()
+        if not released:
+            with outstanding.get_lock():
+                outstanding.value -= 1
+        stop_queue_loggers()
+        results.put((shard, snapshot, metrics.export()))
+
+
+class MultiProcessCrawler(object):
+    ''' PROCESSES crawl processes, each with THREADCOUNT workers and the
+        frontier for the hosts that hash to it, so scraping uses every core.
+        Statistics from all processes are merged into one report, and what
+        metrics keeps (samples and peaks) into this process's metrics. '''
+    def __init__(self, config, restart):
+        self.config = config
+        self.restart = restart
+        self.logger = get_logger("CRAWLER")
+        self.processes = list()
+        # The shards' statistics are merged into this process's copy.
+        scraper.crawl_stats.configure(config)
+
+    def start(self):
+        shards = self.config.processes
+        inboxes = [multiprocessing.Queue() for _ in range(shards)]
+        # One startup count per shard until its frontier is loaded.
+        outstanding = multiprocessing.Value("q", shards)
+        stop = multiprocessing.Event()
+        results = multiprocessing.Queue()
+        self.processes = [
+            multiprocessing.Process(
+                target=run_shard,
+                args=(self.config, self.restart, shard, inboxes, outstanding,
+                      stop, results))
+            for shard in range(shards)]
+        for process in self.processes:
+            process.start()
+        pending = set(range(shards))
+        while pending:
+            # A process that exited before the wait has flushed its result,
+            # so if none comes it died without one.
+            exited = [shard for shard in pending
+                      if self.processes[shard].exitcode is not None]
+            try:
+                shard, snapshot, exported = results.get(timeout=RESULT_WAIT)
+            except queue.Empty:
+                for shard in exited:
+                    self.logger.error(
+                        f"Crawl process {shard} exited with code "
+                        f"{self.processes[shard].exitcode} and no result.")
+                    pending.discard(shard)
+                    stop.set()
+                continue
+            pending.discard(shard)
+            if snapshot is None:
+                self.logger.error(f"Crawl process {shard} failed.")
+            else:
+                scraper.crawl_stats.merge(snapshot)
+                metrics.merge(exported)
+        for process in self.processes:
+            process.join()
+        scraper.generate_report_txt()
+        self.logger.info(f"All {shards} crawl processes finished.")
@@ -0,0 +1,162 @@
+import os
+import time
+import atexit
+import pickle
+import shelve
+import struct
+
+from threading import Thread, Lock
+
+# Records buffered before the log is written and fsynced.
+GROUP_COMMIT_RECORDS = 256
+# Longest time a buffered record waits for its commit, in milliseconds.
+GROUP_COMMIT_MS = 200
+# The log is rewritten once it holds this many times more records than keys.
+COMPACT_RATIO = 2
+COMPACT_MIN_RECORDS = 10000
+
+RECORD_HEADER = struct.Struct(">I")
+
+
+class LogStore(object):
+    ''' Append-only frontier store with the same mapping interface the
+        frontier uses on a shelve. Every write is a length-prefixed pickled
+        (key, value) record; the latest value per key is kept in memory and
+        rebuilt by replaying the log on startup. sync() only commits once
+        GROUP_COMMIT_RECORDS writes are buffered, and a background thread
+        commits whatever is left after GROUP_COMMIT_MS. '''
+    def __init__(self, path, batch_size=GROUP_COMMIT_RECORDS,
+                 batch_ms=GROUP_COMMIT_MS):
+        self.path = path
+        self.batch_size = batch_size
+        self.batch_ms = batch_ms
+        self.index = dict()
+        self.pending = list()
+        self.records = 0
+        self.lock = Lock()
+        self._replay()
+        self.log = open(self.path, "ab")
+        self.closed = False
+        self.flusher = Thread(target=self._flush_loop, daemon=True)
+        self.flusher.start()
+        atexit.register(self.close)
+
+    def _replay(self):
+        if not os.path.exists(self.path):
+            return
+        end = 0
+        with open(self.path, "rb") as log:
+            while True:
+                header = log.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                size, = RECORD_HEADER.unpack(header)
+                data = log.read(size)
+                if len(data) < size:
+                    break
+                try:
+                    key, value = pickle.loads(data)
+                except Exception:
+                    break
+                self.index[key] = value
+                self.records += 1
+                end = log.tell()
+        if end < os.path.getsize(self.path):
+            # Drop a record torn by a crash mid-commit.
+            with open(self.path, "r+b") as log:
+                log.truncate(end)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __getitem__(self, key):
+        return self.index[key]
+
+    def get(self, key, default=None):
+        return self.index.get(key, default)
+
+    def __setitem__(self, key, value):
+        data = pickle.dumps((key, value), pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.index[key] = value
+            self.pending.append(RECORD_HEADER.pack(len(data)) + data)
+
+    def keys(self):
+        return list(self.index.keys())
+
+    def values(self):
+        return list(self.index.values())
+
+    def items(self):
+        return list(self.index.items())
+
+    def sync(self):
+        with self.lock:
+            if len(self.pending) >= self.batch_size:
+                self._commit()
+
+    def flush(self):
+        with self.lock:
+            self._commit()
+
+    def _commit(self):
+        # Caller holds self.lock.
+        if not self.pending or self.closed:
+            return
+        self.log.write(b"".join(self.pending))
+        self.log.flush()
+        os.fsync(self.log.fileno())
+        self.records += len(self.pending)
+        self.pending = list()
+        if (self.records > COMPACT_MIN_RECORDS
+                and self.records > COMPACT_RATIO * len(self.index)):
+            self._compact()
+
+    def _compact(self):
+        # Caller holds self.lock with nothing pending.
+        tmp = f"{self.path}.compact"
+        with open(tmp, "wb") as log:
+            for key, value in self.index.items():
+                data = pickle.dumps((key, value), pickle.HIGHEST_PROTOCOL)
+                log.write(RECORD_HEADER.pack(len(data)))
+                log.write(data)
+            log.flush()
+            os.fsync(log.fileno())
+        self.log.close()
+        os.replace(tmp, self.path)
+        self.log = open(self.path, "ab")
+        self.records = len(self.index)
+
+    def compact(self):
+        with self.lock:
+            self._commit()
+            self._compact()
+
+    def _flush_loop(self):
+        while not self.closed:
+            time.sleep(self.batch_ms / 1000)
+            self.flush()
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self._commit()
+            self.closed = True
+            self.log.close()
+
+
+STORES = {
+    "shelve": shelve.open,
+    "log": LogStore,
+}
+
+
+def open_store(kind, path):
+    if kind not in STORES:
+        raise ValueError(f"Unknown STORE {kind!r}, "
+                         f"expected one of {sorted(STORES)}.")
+    return STORES[kind](path)
@@ -3,10 +3,18 @@ from threading import Thread
 from inspect import getsource
 from utils.download import download
 from utils import get_logger
+from utils.metrics import metrics
 import scraper
 import time
 
 
+def count_response(resp):
+    metrics.inc("pages_total")
+    metrics.inc("responses_total", status=resp.status)
+    if resp.status != 200:
+        metrics.inc("errors_total", status=resp.status)
+
+
 class Worker(Thread):
     def __init__(self, worker_id, config, frontier):
         self.logger = get_logger(f"Worker-{worker_id}", "Worker")
@@ -19,18 +27,34 @@ class Worker(Thread):
         
     def run(self):
         while True:
-            tbd_url = self.frontier.get_tbd_url()
+            with metrics.timer("queue_wait"):
+                tbd_url = self.frontier.get_tbd_url()
             if not tbd_url:
                 self.logger.info("Frontier is empty. Stopping Crawler.")
                 break
-            resp = download(tbd_url, self.config, self.logger)
-            self.logger.info(
-                f"Downloaded {tbd_url}, status <{resp.status}>, "
-                f"using cache {self.config.cache_server}.")
-            scraped_urls = scraper.scraper(tbd_url, resp)
-            for scraped_url in scraped_urls:
-                self.frontier.add_url(scraped_url)
-            self.frontier.mark_url_complete(tbd_url)
-            time.sleep(self.config.time_delay)
-        
-        scraper.generate_report_txt()
+            started = time.perf_counter()
+            scraped_urls = list()
+            try:
+                with metrics.timer("download"):
+                    resp = download(tbd_url, self.config, self.logger)
+                count_response(resp)
+                self.frontier.rate.observe(tbd_url, resp)
+                self.logger.info(
+                    f"Downloaded {tbd_url}, status <{resp.status}>, "
+                    f"in {resp.latency:.3f}s, "
+                    f"using cache {self.config.cache_server}.")
+                with metrics.timer("scrape"):
+                    scraped_urls = scraper.scraper(tbd_url, resp)
+            except Exception:
+                # The url is still marked done below, or the other workers
+                # would wait for it forever.
+                metrics.inc("errors_total", status="exception")
+                self.logger.exception(f"Failed to crawl {tbd_url}.")
+            finally:
+                with metrics.timer("frontier"):
+                    self.frontier.add_urls(scraped_urls, tbd_url)
+            metrics.observe("page", time.perf_counter() - started)
+            if self.config.scheduler == "stack":
+                # The other schedulers already space out fetches per host.
+                with metrics.timer("politeness"):
+                    time.sleep(self.frontier.rate.delay(tbd_url))
@@ -3,15 +3,62 @@ from argparse import ArgumentParser
 
 from utils.server_registration import get_cache_server
 from utils.config import Config
-from crawler import Crawler
+from crawler import Crawler, AsyncCrawler, MultiProcessCrawler
+from utils.templates import template_budget
+import scraper
 
 
-def main(config_file, restart):
+def save_files(config):
+    if config.mode == "processes":
+        return [f"{config.save_file}.{shard}"
+                for shard in range(config.processes)]
+    return [config.save_file]
+
+
+def report(config_file):
+    # report.txt from the last stats checkpoint, also while a crawl runs.
+    cparser = ConfigParser()
+    cparser.read(config_file)
+    config = Config(cparser)
+    config.report_every = 0
+    scraper.crawl_stats.configure(config)
+    for save_file in save_files(config):
+        scraper.crawl_stats.load_checkpoint(f"{save_file}.stats")
+    scraper.generate_report_txt()
+
+
+def templates(config_file, count):
+    # The most fetched url templates and their yield, see utils/templates.py.
+    cparser = ConfigParser()
+    cparser.read(config_file)
+    config = Config(cparser)
+    for save_file in save_files(config):
+        template_budget.load(f"{save_file}.templates")
+    print(f"{'fetches':>8} {'new':>8} {'recent':>6}  template")
+    for template, stats, capped in template_budget.top(count):
+        print(f"{stats.fetches:>8} {stats.new:>8} {stats.recent:>6.2f}  "
+              f"{template}{'  (capped)' if capped else ''}")
+
+
+def main(config_file, restart, mode=None, cache_server=None, refresh=False):
     cparser = ConfigParser()
     cparser.read(config_file)
     config = Config(cparser)
-    config.cache_server = get_cache_server(config, restart)
-    crawler = Crawler(config, restart)
+    if mode:
+        config.mode = mode
+    config.refresh = refresh
+    if cache_server:
+        # e.g. a local benchmarks.cache_server, skips registration.
+        host, port = cache_server.rsplit(":", 1)
+        config.cache_server = (host, int(port))
+    else:
+        config.cache_server = get_cache_server(config, restart)
+    if config.mode == "async":
+        crawler = AsyncCrawler(config, restart)
+    elif config.mode == "processes":
+        crawler = MultiProcessCrawler(config, restart)
+    else:
+        crawler = Crawler(config, restart)
     crawler.start()
 
 
@@ -19,5 +66,19 @@ if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument("--restart", action="store_true", default=False)
     parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--mode", type=str, choices=["threads", "async", "processes"])
+    parser.add_argument("--cache_server", type=str, help="host:port")
+    parser.add_argument("--report", action="store_true", default=False,
+                        help="write report.txt from the last checkpoint and exit")
+    parser.add_argument("--refresh", action="store_true", default=False,
+                        help="crawl the urls of the save file again")
+    parser.add_argument("--templates", type=int, nargs="?", const=20,
+                        help="print the N most fetched url templates and exit")
     args = parser.parse_args()
-    main(args.config_file, args.restart)
+    if args.report:
+        report(args.config_file)
+    elif args.templates:
+        templates(args.config_file, args.templates)
+    else:
+        main(args.config_file, args.restart, args.mode, args.cache_server,
+             args.refresh)
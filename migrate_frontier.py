@@ -0,0 +1,31 @@
+import os
+import shutil
+import shelve
+from argparse import ArgumentParser
+
+from crawler.store import LogStore
+
+
+def main(source, target):
+    if os.path.exists(target):
+        raise SystemExit(f"{target} already exists, not overwriting it.")
+    log = LogStore(target)
+    with shelve.open(source, "r") as save:
+        for urlhash, value in save.items():
+            log[urlhash] = value
+            log.sync()
+        count = len(save)
+    log.close()
+    # Keep the robots.txt cache with the save file it belongs to.
+    if os.path.exists(f"{source}.robots"):
+        shutil.copyfile(f"{source}.robots", f"{target}.robots")
+    print(f"Copied {count} urls from {source} to {target}.")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="Convert a shelve frontier save file to the log format.")
+    parser.add_argument("source", type=str)
+    parser.add_argument("target", type=str)
+    args = parser.parse_args()
+    main(args.source, args.target)
@@ -1,23 +1,39 @@
 import re
-import logging
-from urllib.parse import urlparse, urljoin, parse_qs
+from hashlib import sha256
+from inspect import getsource, getmodule
+from urllib.parse import urlparse, urljoin
 from bs4 import BeautifulSoup
+from utils import get_queue_logger
 from utils.constants import stopwords, seed_urls
-import urllib.robotparser
-from collections import defaultdict
-import copy
-
-
-unique_pages = set()
-longest_page = {'url': 'default', 'length': 0}
-word_frequency = defaultdict(int)
-sub_domains = defaultdict(int)
+from utils.robots import robots_cache
+from utils.simhash import SimHashIndex, simhash
+from utils.page_cache import page_cache
+from utils.url_filter import UrlFilter
+from utils.canonical import canonicalizer
+from utils.templates import template_budget
+from utils.stats import CrawlStats
+from utils.metrics import metrics
+
+try:
+    # lxml builds the tree in C, several times faster than html.parser.
+    import lxml
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+NON_WORD = re.compile('[^A-Za-z0-9]+')
+STOPWORDS = set(stopwords)
+
+crawl_stats = CrawlStats()
+near_duplicates = SimHashIndex()
+url_filter = UrlFilter(seed_urls)
 
 
 def scraper(url, resp):
     #if url !=
     links = extract_next_links(url, resp)
-    logging_data()
+    # after extract_next_links counted the page's new content, if any
+    template_budget.fetched(url)
     return links
 
 def extract_next_links(url, resp):
@@ -31,54 +47,68 @@ def extract_next_links(url, resp):
     #         resp.raw_response.content: the content of the page!
     # Return a list with the hyperlinks (as strings) scrapped from resp.raw_response.content
 
+    # Checked before raw_response is read, which unpickles the page
+    if url != resp.url or resp.status not in (200, 304):
+        return list()
+
     #Initial check 
     if resp.raw_response:
         if url != resp.raw_response.url:
             if url not in resp.raw_response.url:
                 log_invalid(url, 'Redirection of url')
                 return list()
-
-        
-    if url != resp.url or resp.status != 200: 
-        return list()
-        
-    # Check for Less quality pages
-    if not is_high_quality(resp):
+    elif resp.skipped:
+        # too large or not html, see utils/response.py
+        log_invalid(url, f"Skipped body - {resp.skipped}")
         return list()
 
-    linked_pages = set()
-    soup = BeautifulSoup(resp.raw_response.content, "html.parser")
-
-    for a_tag in soup.findAll("a"):
-        href = a_tag.attrs.get("href")
+    # Parse once, links, quality and deliverables all read from it. A page
+    # unchanged since the last crawl reuses that parse
+    page = page_cache.lookup(url, resp)
+    if page is None:
+        if resp.status != 200:
+            return list()
+        try:
+            with metrics.timer("parse"):
+                page = analyze_page(url, resp)
+        except Exception:
+            metrics.inc("errors_total", status="parse")
+            return list()
+        page_cache.remember(url, resp, page)
 
-        if href is None:
-            continue
-        
-        possibleInd = href.find('#')
-        if possibleInd != -1:
-            href = href[:possibleInd]
+    # Check for Less quality pages
+    if not is_high_quality(page):
+        return list()
 
-        href = modify_if_relative(href,url)
+    # Template clones and mirrors still count for the report, but their
+    # links were already queued from the original
+    original = near_duplicates.check(url, page.fingerprint)
+    if original is not None:
+        log_invalid(url, f"Near duplicate of {original}")
+        deliverables(url, page)
+        return list()
 
-        condition, reason = is_valid(href)
-        
-        if condition:
-            linked_pages.add(href)
-        elif reason != "Non-seed-url":
-            log_invalid(href, reason)
+    template_budget.new_content(url)
+    linked_pages = set()
+    with metrics.timer("is_valid"):
+        for href in page.outlinks:
+            # one url for every spelling of a page, see utils/canonical.py
+            link = canonicalizer.canonical(href)
+            condition, reason = is_valid(link)
+
+            if condition:
+                linked_pages.add(link)
+                canonicalizer.record(href, link)
+            elif reason != "Non-seed-url":
+                log_invalid(link, reason)
     
     ## Returning Delivrables for this url
-    deliverables(url,resp)
+    deliverables(url, page)
     return list(linked_pages)
 
 def log_invalid(url, reason):
-    logger = logging.getLogger('invalid')
-    logger.setLevel(logging.INFO)
-    file_handler = logging.FileHandler('invalid_url.log')
-    formatter = logging.Formatter('%(asctime)s : %(levelname)s : %(name)s : %(message)s')
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+    # written by a background thread, see utils.get_queue_logger
+    logger = get_queue_logger('invalid', 'invalid_url.log')
     logger.info(f"Invalid url - {url},Reason - {reason}")
 
 def modify_if_relative(relative_url,parent_url):
@@ -103,198 +133,129 @@ def modify_if_relative(relative_url,parent_url):
     return relative_url
 
 def can_crawl(url, parsed):
-    # checking robots.txt
-    try:
-        rp = urllib.robotparser.RobotFileParser()
-        rp.set_url("http://" + parsed.netloc + "/robots.txt")
-        rp.read()
-        return rp.can_fetch("*", url)
-    except:
-        # means that there is no robots.txt for that website
-        return True
+    # checking robots.txt, fetched once per host and shared by all workers
+    return robots_cache.can_fetch(url, parsed.netloc)
 
 def is_trap(parsed):
     # was able to identify what causes traps and get regular expressions from:
     # https://support.archive-it.org/hc/en-us/articles/208332943-Identify-and-avoid-crawler-traps-
+    # the rules themselves are compiled once in utils/url_filter.py
+    reason = url_filter.trap_reason(parsed)
+    return bool(reason), reason
+
+class Page(object):
+    # Everything the scraper needs from one response, from a single parse:
+    #   outlinks: hrefs with fragments cut and relative links resolved
+    #   tokens: every lowercased alphanumeric token, in page order
+    #   words: the distinct tokens of 3 or more characters
+    #   fingerprint: SimHash of the tokens, for near duplicates
+    def __init__(self, outlinks, tokens):
+        self.outlinks = outlinks
+        self.tokens = tokens
+        self.words = {word for word in tokens if len(word) >= 3}
+        self.word_count = len(self.words)
+        self.fingerprint = simhash(tokens)
+
+    def __getstate__(self):
+        # the page cache keeps everything but the text itself
+        state = dict(self.__dict__)
+        state['tokens'] = None
+        return state
+
+def analyze_page(url, resp):
+    soup = BeautifulSoup(resp.raw_response.content, HTML_PARSER)
+
+    outlinks = list()
+    for a_tag in soup.find_all("a", href=True):
+        href = a_tag["href"]
+        possibleInd = href.find('#')
+        if possibleInd != -1:
+            href = href[:possibleInd]
+        outlinks.append(modify_if_relative(href, url))
 
-    # long url traps
-    if len(str(parsed.geturl())) > 200:
-        return True, "Long url traps"
-
-    # duplicate url traps
-    path_segments = parsed.path.lower().split("/")
-    path_segments = path_segments[1:]
-    
-    REPEATER = re.compile(r"(.+/)\1+")
-    match = REPEATER.findall(f"{parsed.geturl()}/")
-    
-    if(len(match) > 0):
-        return True, "Duplicate Path Trap"
-    
-
-    # Check for Session ID traps
-    if "session" in path_segments or "session" in parsed.query:   
-        return True, "Session Trap"
-
-
-    # repeating directories
-    if re.match("^.*?(/.+?/).*?\1.*$|^.*?/(.+?/)\2.*$", parsed.path):
-        return True, "Repeating Directories Trap"
-
-    # extra directories
-    if re.match("^.*(/misc|/sites|/all|/themes|/modules|/profiles|/css|/field|/node|/theme){3}.*$", parsed.path):
-        return True, "Extra Directories Trap"
+    words = soup.get_text(" ", strip=True).lower()
+    tokens = NON_WORD.sub(' ', words).split()
+    return Page(outlinks, tokens)
 
-    # empty
-    if parsed is None:
-        return False, ""
-    
-    #dynamic trap check
-    url_query = parsed.query
-    if url_query != "":
-        query_params = parse_qs(url_query)
-        if len(query_params) > 7:
-            return True, "Dynamic Trap"
-
-    # avoid club pages have events from too early
-    if re.match(r".*(calendar|date|gallery|image|wp-content|pdf|img_).*?$", parsed.path.lower()):
-        return True, "Club Page Trap"
-
-    # avoid informatics' monthly archives
-    if re.match(r".*\/20\d\d-\d\d*", parsed.path.lower()):
-        return True, "Month Trap"
-
-    # no event calendars
-    if "/event/" in parsed.path or "/events/" in parsed.path:
-        return True, "Calendar Trap"
-    return False, ""
-
-def is_high_quality(resp):
-    try:
-        # checks if high quality by amount of text
-        amount_of_text = len(get_text(resp))
-        if amount_of_text > 100:
-            return True
-        return False
-    except:
-        return False
-
-def get_text(resp):
-    # scraps entire webpage's text and tokenizes
-    soup = BeautifulSoup(resp.raw_response.content, "html.parser")
-    words = soup.get_text(" ", strip=True)
-    words = words.lower()
-    words = re.sub('[^A-Za-z0-9]+', ' ', words)
-
-    # takes all duplicates out
-    word_list = words.split()
-    word_set = set(word_list)
-    copy_set = copy.deepcopy(word_set)
-
-    # removes words that shouldn't be considered
-    for word in copy_set:
-        if len(word) < 3:
-            word_set.remove(word)
-    return word_set
-
-def deliverables(url, resp):
-    global unique_pages
-    global longest_page
-    global word_frequency
-    global sub_domains
-    global stopwords
+def is_high_quality(page):
+    # checks if high quality by amount of text
+    return page.word_count > 100
 
-    try:
-        text = get_text(resp)
-    except:
-        text = 0
-    
+def deliverables(url, page):
     parsed = urlparse(url)
-    page = parsed.scheme + "://" + parsed.netloc + parsed.path
-
-   # increments unique urls to find total
-    unique_pages.add(page)
-
-    # compares for longest page
-    if len(text) > longest_page['length']:
-        longest_page['length'] = len(text)
-        longest_page['url'] = page
+    page_url = parsed.scheme + "://" + parsed.netloc + parsed.path
 
-    # finds most common word
-    for word in text:
-        if word not in stopwords:
-            word_frequency[word] += 1
-    
-    #finding no of subdomains in ics.uci.edu
-    if url.find('ics.uci.edu') > 0:
-        sub_domains[page] += 1
+    # unique pages, longest page, most common words (without stopwords)
+    # and pages per subdomain in ics.uci.edu
+    words = [word for word in page.words if word not in STOPWORDS]
+    crawl_stats.add_page(
+        page_url, words, page.word_count, url.find('ics.uci.edu') > 0)
         
 def logging_data():
-    top50 = list(sorted(word_frequency.items(), key=lambda x: x[1], reverse=True))[:50]
-    logger = logging.getLogger('report')
-    logger.setLevel(logging.INFO)
-    file_handler = logging.FileHandler('report_data.log')
-    formatter = logging.Formatter('%(asctime)s : %(levelname)s : %(name)s : %(message)s')
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
-    logger.info(f"Unique Pages:{len(unique_pages)}, Longest Page:{longest_page['url']} of len {longest_page['length']}\n"
+    with crawl_stats.lock:
+        top50 = crawl_stats.word_frequency.top_items()[:50]
+        unique_count = len(crawl_stats.unique_pages)
+        longest_page = dict(crawl_stats.longest_page)
+        sub_domains = dict(crawl_stats.sub_domains)
+    logger = get_queue_logger('report', 'report_data.log')
+    logger.info(f"Unique Pages:{unique_count}, Longest Page:{longest_page['url']} of len {longest_page['length']}\n"
                 f"Most Common:{top50}\nSubDomains: {sub_domains}")
 
+# logged with every stats checkpoint (REPORTEVERY pages) rather than every page
+crawl_stats.on_checkpoint.append(logging_data)
+
 def is_valid(url):
     # Decide whether to crawl this url or not. 
     # If you decide to crawl it, return True; otherwise return False.
     # There are already some conditions that return False.
 
     try:
-        parsed = urlparse(url)
-        if parsed.scheme not in set(["http", "https"]):
-            return False, "Https missing"
-        
-        #Checking if url exists in seed_urls
-        if not any(check_url in url for check_url in seed_urls):
-            return False, "Non-seed-url"
+        # scheme, seed domain, trap and extension rules, memoized per url
+        parsed, reason, trap_reason = url_filter.check(url)
+        if reason:
+            return False, reason
 
         if not can_crawl(url, parsed):
             return False, "Non crawllable"
 
-        #Checking if trap exist in url
-        trap_bool, trap_reason = is_trap(parsed)
-        if trap_bool:
-            return False, f"Is a Trap - {trap_reason}"
-        
-        if re.match(
-            r".*\.(css|js|bmp|gif|jpe?g|ico"
-            + r"|png|tiff?|mid|mp2|mp3|mp4"
-            + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
-            + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
-            + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
-            + r"|epub|dll|cnf|tgz|sha1"
-            + r"|thmx|mso|arff|rtf|jar|csv"
-            + r"|rm|smil|wmv|swf|wma|zip|rar|gz)$", parsed.path.lower()):
-            return False, "Re Matching Failed"
-    
+        if trap_reason:
+            return False, trap_reason
+
+        # traps no rule above knows, see utils/templates.py
+        if template_budget.is_capped(url):
+            return False, "Template over budget"
+
         return True, ""
 
     except TypeError:
-        print ("TypeError for ", parsed)
+        print ("TypeError for ", url)
         raise
 
+def rules_version():
+    # Fingerprint of the url filters and seed domains. Verdicts saved under
+    # a different version are re-checked when the frontier is resumed.
+    source = getsource(is_valid) + getsource(getmodule(UrlFilter)) + repr(seed_urls)
+    return sha256(source.encode("utf-8")).hexdigest()[:8]
+
 def generate_report_txt():
     # generate the report with all questions from canvas and their corresponding answers
     report = open('report.txt', 'w')
 
     questions = []
+    with crawl_stats.lock:
+        unique_count = len(crawl_stats.unique_pages)
+        longest_page = dict(crawl_stats.longest_page)
+        top50 = crawl_stats.word_frequency.most_common(50)
+        sub_domains = dict(crawl_stats.sub_domains)
 
 
     # Question 1
-    questions.append(f'1. How many unique pages did you find? \nThere are {len(unique_pages)} unique pages.\n\n')
+    questions.append(f'1. How many unique pages did you find? \nThere are {unique_count} unique pages.\n\n')
     # Question 2
-    questions.append(f'2. What is the longest page in terms of the number of words? \nThe longest page in terms of the number of words is {longest_page['url']} with {longest_page['length']} words.\n\n')
+    questions.append(f'2. What is the longest page in terms of the number of words? \nThe longest page in terms of the number of words is {longest_page["url"]} with {longest_page["length"]} words.\n\n')
     # Question 3
-    # global frequency_dict
-    sorted_freq = sorted(word_frequency.items(), key=lambda x: (-x[1], x[0]))
     word_str = ''
-    for i, (word, frequency) in enumerate(sorted_freq[:50]):
+    for i, (word, frequency) in enumerate(top50):
         word_str += f'Word {(i+1)}: {word}, Frequency: {frequency}\n'
     questions.append(f'3. What are the 50 most common words in the entire set of pages crawled under these domains? \nThe 50 most common words are listed as follows:\n{word_str}\n')
     # Question 4
@@ -1,7 +1,18 @@
 import os
+import time
+import atexit
 import logging
+from queue import SimpleQueue
+from threading import Lock
 from hashlib import sha256
 from urllib.parse import urlparse
+from logging.handlers import QueueHandler, QueueListener
+
+# Seconds between flushes of the files written by get_queue_logger.
+QUEUE_LOG_FLUSH = 1.0
+queue_loggers = dict()
+queue_loggers_lock = Lock()
+queue_log_rates = dict()
 
 def get_logger(name, filename=None):
     logger = logging.getLogger(name)
@@ -22,6 +33,89 @@ def get_logger(name, filename=None):
     return logger
 
 
+class BatchFileHandler(logging.FileHandler):
+    ''' FileHandler that leaves records in the file buffer and only flushes
+        every QUEUE_LOG_FLUSH seconds, or when closed. '''
+    def __init__(self, filename):
+        super().__init__(filename)
+        self.flushed = time.monotonic()
+
+    def flush(self):
+        now = time.monotonic()
+        if now - self.flushed >= QUEUE_LOG_FLUSH:
+            super().flush()
+            self.flushed = now
+
+    def close(self):
+        self.flushed = 0
+        super().close()
+
+
+class RateLimit(logging.Filter):
+    ''' Lets at most rate records a second through, 0 for no limit. '''
+    def __init__(self, rate=0):
+        super().__init__()
+        self.rate = rate
+        self.tokens = rate
+        self.last = time.monotonic()
+        self.dropped = 0
+
+    def filter(self, record):
+        if not self.rate:
+            return True
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens < 1:
+            self.dropped += 1
+            return False
+        self.tokens -= 1
+        return True
+
+
+def get_queue_logger(name, filename):
+    ''' Logger whose records are written to filename by a background
+        QueueListener, so callers only pay for a queue put. Set up once per
+        name; the file is flushed at exit. '''
+    with queue_loggers_lock:
+        if name in queue_loggers:
+            return queue_loggers[name][0]
+        logger = logging.getLogger(name)
+        logger.setLevel(logging.INFO)
+        handler = BatchFileHandler(filename)
+        handler.setFormatter(logging.Formatter(
+            '%(asctime)s : %(levelname)s : %(name)s : %(message)s'))
+        records = SimpleQueue()
+        listener = QueueListener(records, handler)
+        queue_handler = QueueHandler(records)
+        queue_handler.addFilter(RateLimit(queue_log_rates.get(name, 0)))
+        logger.addHandler(queue_handler)
+        listener.start()
+        queue_loggers[name] = (logger, queue_handler, listener, handler)
+        return logger
+
+
+def set_log_rate(name, rate):
+    ''' Sample the records of the get_queue_logger name down to rate a
+        second, 0 for all of them. '''
+    with queue_loggers_lock:
+        queue_log_rates[name] = rate
+        if name in queue_loggers:
+            queue_loggers[name][1].filters[0].rate = rate
+
+
+@atexit.register
+def stop_queue_loggers():
+    ''' Write out everything still queued and close the files. Called at
+        exit, and by processes that leave without running atexit. '''
+    with queue_loggers_lock:
+        for logger, queue_handler, listener, handler in queue_loggers.values():
+            logger.removeHandler(queue_handler)
+            listener.stop()
+            handler.close()
+        queue_loggers.clear()
+
+
 def get_urlhash(url):
     parsed = urlparse(url)
     # everything other than scheme.
@@ -0,0 +1,122 @@
+import time
+import asyncio
+from urllib.parse import urlencode
+
+from utils.download import to_response, error_response, backoff
+
+
+class ConnectionPool(object):
+    ''' Keep-alive HTTP/1.1 connections to the cache server, shared by every
+        fetch task on one event loop. At most size requests are in flight;
+        idle connections are reused instead of opening a new one. '''
+    def __init__(self, host, port, size):
+        self.host = host
+        self.port = port
+        self.idle = list()
+        self.slots = asyncio.Semaphore(size)
+
+    async def get(self, path):
+        async with self.slots:
+            while True:
+                reused = bool(self.idle)
+                if reused:
+                    reader, writer = self.idle.pop()
+                else:
+                    reader, writer = await asyncio.open_connection(
+                        self.host, self.port)
+                try:
+                    writer.write(
+                        f"GET {path} HTTP/1.1\r\n"
+                        f"Host: {self.host}:{self.port}\r\n"
+                        f"Connection: keep-alive\r\n\r\n".encode("latin-1"))
+                    await writer.drain()
+                    status, keep_alive, body = await read_response(reader)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    writer.close()
+                    if reused:
+                        # The server dropped an idle connection, use a new one.
+                        continue
+                    raise
+                except BaseException:
+                    writer.close()
+                    raise
+                if keep_alive:
+                    self.idle.append((reader, writer))
+                else:
+                    writer.close()
+                return status, body
+
+    def close(self):
+        for _, writer in self.idle:
+            writer.close()
+        self.idle = list()
+
+
+async def read_response(reader):
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Connection closed by the cache server.")
+    version, status = status_line.split(None, 2)[:2]
+    headers = dict()
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip().lower()
+
+    if version == b"HTTP/1.0":
+        keep_alive = headers.get("connection") == "keep-alive"
+    else:
+        keep_alive = headers.get("connection") != "close"
+
+    if headers.get("transfer-encoding") == "chunked":
+        chunks = list()
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                # Skip trailers.
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+        body = b"".join(chunks)
+    elif "content-length" in headers:
+        body = await reader.readexactly(int(headers["content-length"]))
+    else:
+        body = await reader.read()
+        keep_alive = False
+    return int(status), keep_alive, body
+
+
+async def download(url, config, pool, logger=None):
+    query = urlencode([("q", f"{url}"), ("u", f"{config.user_agent}")])
+    start = time.perf_counter()
+    for attempt in range(config.retries + 1):
+        try:
+            status, content = await asyncio.wait_for(
+                pool.get(f"/?{query}"),
+                config.connect_timeout + config.read_timeout)
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError,
+                ValueError) as e:
+            if attempt == config.retries:
+                response = error_response(
+                    url, f"Spacetime connection error {e!r} with url {url}.",
+                    logger=logger)
+                response.latency = time.perf_counter() - start
+                response.attempts = attempt + 1
+                return response
+            reason = repr(e)
+        else:
+            if status < 500 or attempt == config.retries:
+                break
+            reason = f"status <{status}>"
+        delay = backoff(attempt, config.backoff)
+        if logger:
+            logger.warning(f"Retrying {url} in {delay:.2f}s after {reason}.")
+        await asyncio.sleep(delay)
+    response = to_response(url, status, content, logger)
+    response.latency = time.perf_counter() - start
+    response.attempts = attempt + 1
+    return response
@@ -0,0 +1,158 @@
+from fnmatch import fnmatchcase
+from functools import lru_cache
+from threading import Lock
+from urllib.parse import urlsplit, urlunsplit
+
+from utils import normalize
+
+# Canonical forms remembered for this many distinct urls.
+MEMO_SIZE = 1 << 18
+
+RULES = ("case", "port", "fragment", "dots", "index", "sort", "params")
+# Dropped from every query until configure() reads TRACKINGPARAMS.
+TRACKING_PARAMS = ("utm_*", "fbclid", "gclid", "msclkid", "mc_cid", "mc_eid")
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+INDEX_PAGES = {"index.html", "index.htm", "index.php", "default.htm",
+               "default.html", "default.asp", "default.aspx"}
+
+
+def remove_dot_segments(path):
+    ''' RFC 3986 section 5.2.4, "/a/./b/../c" is "/a/c". '''
+    if "." not in path:
+        return path
+    output = list()
+    segments = path.split("/")
+    for segment in segments:
+        if segment == ".":
+            continue
+        if segment == "..":
+            if len(output) > 1:
+                output.pop()
+            continue
+        output.append(segment)
+    if segments[-1] in (".", ".."):
+        # "/a/b/.." names the directory /a/, keep its slash.
+        output.append("")
+    return "/".join(output)
+
+
+class Canonicalizer(object):
+    ''' One url for every spelling of it, applied before urls are hashed so
+        the frontier fetches each page once. The rules in CANONICAL:
+            case: lowercase scheme and host
+            port: drop :80 from http and :443 from https
+            fragment: drop #fragment
+            dots: resolve "." and ".." path segments
+            index: drop a trailing index.html, default.aspx, ...
+            sort: sort the query parameters
+            params: drop the parameters in TRACKINGPARAMS, and those in
+                IGNOREPARAMS for that host (fnmatch patterns)
+        A trailing slash is always stripped, like utils.normalize, and the
+        rules are applied until the url stops changing. canonical(url) is
+        memoized per url. '''
+    def __init__(self, memo_size=MEMO_SIZE):
+        self.memo_size = memo_size
+        self.rules = set(RULES)
+        self.tracking = list(TRACKING_PARAMS)
+        self.ignore = dict()
+        self.canonical = lru_cache(maxsize=memo_size)(self._canonical)
+        self.lock = Lock()
+        self.rewritten = set()
+        self.targets = set()
+        self.direct = set()
+        self.saved = 0
+
+    def configure(self, config):
+        unknown = set(config.canonical) - set(RULES)
+        if unknown:
+            raise ValueError(f"Unknown CANONICAL {sorted(unknown)!r}, "
+                             f"expected some of {list(RULES)}.")
+        self.rules = set(config.canonical)
+        self.tracking = [pattern.lower() for pattern in config.tracking_params]
+        self.ignore = {
+            host.lower(): [pattern.lower() for pattern in patterns]
+            for host, patterns in config.ignore_params.items()}
+        self.canonical = lru_cache(maxsize=self.memo_size)(self._canonical)
+
+    def _keep_param(self, param, host_patterns):
+        name = param.split("=", 1)[0].lower()
+        return not any(fnmatchcase(name, pattern)
+                       for pattern in self.tracking + host_patterns)
+
+    def _canonical(self, url):
+        # normalize can leave a url another pass rewrites, e.g. /a/?/
+        # loses the / of the query and then of the path. Repeated until
+        # nothing changes, so canonical(canonical(url)) == canonical(url).
+        while True:
+            canonical = self._rewrite(url)
+            if canonical == url:
+                return canonical
+            url = canonical
+
+    def _rewrite(self, url):
+        try:
+            scheme, netloc, path, query, fragment = urlsplit(url)
+        except ValueError:
+            # e.g. a broken IPv6 host, left for is_valid to reject.
+            return normalize(url)
+        rules = self.rules
+        userinfo, at, hostport = netloc.rpartition("@")
+        host, port = hostport, ""
+        if ":" in hostport and not hostport.endswith("]"):
+            host, _, port = hostport.rpartition(":")
+        if "case" in rules:
+            scheme = scheme.lower()
+            host = host.lower()
+        if "port" in rules and port == DEFAULT_PORTS.get(scheme.lower()):
+            port = ""
+        netloc = f"{userinfo}{at}{host}{':' if port else ''}{port}"
+        if "dots" in rules:
+            path = remove_dot_segments(path)
+        if "index" in rules:
+            # Past the trailing slashes normalize strips, as /a/index.html/
+            # is /a/index.html after one pass.
+            directory, slash, page = path.rstrip("/").rpartition("/")
+            if slash and page.lower() in INDEX_PAGES:
+                path = directory + slash
+        if query and ("sort" in rules or "params" in rules):
+            params = [param for param in query.split("&") if param]
+            if "params" in rules:
+                host_patterns = self.ignore.get(host.lower(), list())
+                params = [param for param in params
+                          if self._keep_param(param, host_patterns)]
+            if "sort" in rules:
+                params.sort()
+            query = "&".join(params)
+        if "fragment" in rules:
+            fragment = ""
+        return normalize(urlunsplit((scheme, netloc, path, query, fragment)))
+
+    def record(self, url, canonical):
+        ''' Account a link to url that will be crawled as canonical. Counts
+            every spelling after the first that a page is linked with, so
+            saved is a lower bound: a page first linked by its canonical
+            url and only later by another spelling is not counted. '''
+        with self.lock:
+            if url == canonical:
+                key = hash(canonical)
+                if key in self.targets and key not in self.direct:
+                    self.direct.add(key)
+                    self.saved += 1
+                return
+            key = hash(url)
+            if key in self.rewritten:
+                return
+            self.rewritten.add(key)
+            target = hash(canonical)
+            if target in self.targets:
+                self.saved += 1
+            else:
+                self.targets.add(target)
+
+    def summary(self):
+        with self.lock:
+            return (f"Canonical urls saved at least {self.saved} fetches, "
+                    f"{len(self.rewritten)} urls were rewritten.")
+
+
+canonicalizer = Canonicalizer()
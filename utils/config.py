@@ -8,12 +8,64 @@ class Config(object):
         assert self.user_agent != "DEFAULT AGENT", "Set useragent in config.ini"
         assert re.match(r"^[a-zA-Z0-9_ ,]+$", self.user_agent), "User agent should not have any special characters outside '_', ',' and 'space'"
         self.threads_count = int(config["LOCAL PROPERTIES"]["THREADCOUNT"])
+        self.mode = config["LOCAL PROPERTIES"].get("MODE", "threads").strip()
+        self.concurrency = int(config["LOCAL PROPERTIES"].get("CONCURRENCY", "100"))
+        self.parse_workers = int(config["LOCAL PROPERTIES"].get("PARSERS", "4"))
+        self.processes = int(config["LOCAL PROPERTIES"].get("PROCESSES", "4"))
         self.save_file = config["LOCAL PROPERTIES"]["SAVE"]
+        self.store = config["LOCAL PROPERTIES"].get("STORE", "shelve").strip()
+        self.stats = config["LOCAL PROPERTIES"].get("STATS", "exact").strip()
+        self.stats_words = int(config["LOCAL PROPERTIES"].get("STATSWORDS", "0"))
+        # Pages between checkpoints of the report statistics, 0 for none.
+        self.report_every = int(config["LOCAL PROPERTIES"].get("REPORTEVERY", "1000"))
+        # Port of the /metrics endpoint and seconds between summary lines,
+        # 0 turns either off.
+        self.metrics_port = int(config["LOCAL PROPERTIES"].get("METRICSPORT", "0"))
+        self.metrics_interval = float(config["LOCAL PROPERTIES"].get("METRICSINTERVAL", "0"))
+        # Most invalid urls logged per second, 0 logs all of them.
+        self.invalid_log_rate = float(config["LOCAL PROPERTIES"].get("INVALIDLOGRATE", "0"))
+        # Crawl the downloaded urls of the save file again, see --refresh.
+        self.refresh = False
 
         self.host = config["CONNECTION"]["HOST"]
         self.port = int(config["CONNECTION"]["PORT"])
+        # Download timeouts and retries, in seconds.
+        self.connect_timeout = float(config["CONNECTION"].get("CONNECTTIMEOUT", "5"))
+        self.read_timeout = float(config["CONNECTION"].get("READTIMEOUT", "30"))
+        self.retries = int(config["CONNECTION"].get("RETRIES", "3"))
+        self.backoff = float(config["CONNECTION"].get("BACKOFF", "0.5"))
 
         self.seed_urls = config["CRAWLER"]["SEEDURL"].split(",")
         self.time_delay = float(config["CRAWLER"]["POLITENESS"])
+        self.scheduler = config["CRAWLER"].get("SCHEDULER", "stack").strip()
+        self.rate = config["CRAWLER"].get("RATE", "fixed").strip()
+        self.max_delay = float(config["CRAWLER"].get("MAXDELAY", "60"))
+        self.priority = [
+            name.strip() for name in
+            config["CRAWLER"].get("PRIORITY", "depth,host,novelty").split(",")
+            if name.strip()]
+        self.max_host_queue = int(config["CRAWLER"].get("MAXHOSTQUEUE", "0"))
+        # Largest response loaded in bytes, 0 for any size, and whether
+        # only html is, see utils/response.py.
+        self.max_body = int(config["CRAWLER"].get("MAXBODY", "0"))
+        self.html_only = config["CRAWLER"].getboolean("HTMLONLY", False)
+        # Template budgets, see utils/templates.py. TEMPLATEYIELD 0 caps none.
+        self.template_min = int(config["CRAWLER"].get("TEMPLATEMIN", "50"))
+        self.template_yield = float(config["CRAWLER"].get("TEMPLATEYIELD", "0"))
+        # Rewrites that make equivalent urls one, see utils/canonical.py.
+        self.canonical = [
+            name.strip() for name in config["CRAWLER"].get(
+                "CANONICAL", "case,port,fragment,dots,index,sort,params").split(",")
+            if name.strip()]
+        self.tracking_params = [
+            name.strip() for name in config["CRAWLER"].get(
+                "TRACKINGPARAMS", "utm_*,fbclid,gclid,msclkid,mc_cid,mc_eid").split(",")
+            if name.strip()]
+        # "host: param param, host: param", parameters dropped per host.
+        self.ignore_params = dict()
+        for entry in config["CRAWLER"].get("IGNOREPARAMS", "").split(","):
+            host, _, names = entry.partition(":")
+            if host.strip():
+                self.ignore_params[host.strip()] = names.split()
 
         self.cache_server = None
\ No newline at end of file
@@ -1,25 +1,76 @@
 import requests
 import cbor
 import time
+import random
+from threading import local
 from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
 
 from utils.response import Response
 
+# One keep-alive session per worker thread, requests.Session is not
+# guaranteed to be thread safe.
+sessions = local()
+
+def get_session():
+    session = getattr(sessions, "session", None)
+    if session is None:
+        session = requests.Session()
+        session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        sessions.session = session
+    return session
+
+def backoff(attempt, base):
+    # Full jitter: anywhere between 0 and base * 2^attempt seconds.
+    return random.uniform(0, base * 2 ** attempt)
+
 def download(url, config, logger=None):
     host, port = config.cache_server
-    allow_redirects=True
-    resp = requests.get(
-        f"http://{host}:{port}/",
-        params=[("q", f"{url}"), ("u", f"{config.user_agent}")],
-        )
+    start = time.perf_counter()
+    for attempt in range(config.retries + 1):
+        try:
+            resp = get_session().get(
+                f"http://{host}:{port}/",
+                params=[("q", f"{url}"), ("u", f"{config.user_agent}")],
+                timeout=(config.connect_timeout, config.read_timeout),
+                )
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == config.retries:
+                response = error_response(
+                    url, f"Spacetime connection error {e!r} with url {url}.",
+                    logger=logger)
+                response.latency = time.perf_counter() - start
+                response.attempts = attempt + 1
+                return response
+            reason = repr(e)
+        else:
+            if resp.status_code < 500 or attempt == config.retries:
+                break
+            reason = f"status <{resp.status_code}>"
+        delay = backoff(attempt, config.backoff)
+        if logger:
+            logger.warning(f"Retrying {url} in {delay:.2f}s after {reason}.")
+        time.sleep(delay)
+    response = to_response(url, resp.status_code, resp.content, logger)
+    response.latency = time.perf_counter() - start
+    response.attempts = attempt + 1
+    return response
 
+def to_response(url, status, content, logger=None):
+    # Decode a cache server reply, shared by the threaded and asyncio paths.
     try:
-        if resp and resp.content:
-            return Response(cbor.loads(resp.content))
+        if status < 400 and content:
+            return Response(cbor.loads(content))
     except (EOFError, ValueError) as e:
         pass
-    logger.error(f"Spacetime Response error {resp} with url {url}.")
+    return error_response(
+        url, f"Spacetime Response error <{status}> with url {url}.",
+        status, logger)
+
+def error_response(url, error, status=None, logger=None):
+    if logger:
+        logger.error(error)
     return Response({
-        "error": f"Spacetime Response error {resp} with url {url}.",
-        "status": resp.status_code,
-        "url": url})
\ No newline at end of file
+        "error": error,
+        "status": status,
+        "url": url})
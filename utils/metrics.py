@@ -0,0 +1,258 @@
+import time
+import bisect
+
+from threading import Thread, Lock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds in seconds of the latency histogram buckets.
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histogram(object):
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+
+class Timer(object):
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class NullTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(
+        f'{key}="{str(value)}"'.replace("\n", " ") for key, value in labels)
+    return "{" + pairs + "}"
+
+
+class Metrics(object):
+    ''' Per-stage latency histograms, counters and gauges for the crawl.
+        Until configure() enables it every call returns straight away, so
+        the instrumentation left in the workers costs next to nothing. '''
+    def __init__(self):
+        self.enabled = False
+        self.lock = Lock()
+        self.histograms = dict()
+        self.counters = dict()
+        self.gauges = dict()
+        # Every seconds observed of the stages passed to keep().
+        self.samples = dict()
+        self.peaks = dict()
+        self.started = time.time()
+        self.server = None
+        self.reporter = None
+
+    def configure(self, config, logger=None):
+        ''' Serve /metrics on METRICSPORT and log a summary line every
+            METRICSINTERVAL seconds. Either one set enables metrics. '''
+        if not (config.metrics_port or config.metrics_interval):
+            return
+        self.enabled = True
+        if config.metrics_port and self.server is None:
+            self.server = MetricsServer(("127.0.0.1", config.metrics_port), self)
+            Thread(target=self.server.serve_forever, daemon=True).start()
+        if config.metrics_interval and logger and self.reporter is None:
+            self.reporter = Thread(
+                target=self._report, args=(config.metrics_interval, logger),
+                daemon=True)
+            self.reporter.start()
+
+    def timer(self, stage):
+        ''' with metrics.timer("download"): ... '''
+        if not self.enabled:
+            return NULL_TIMER
+        return Timer(self, stage)
+
+    def observe(self, stage, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+            kept = self.samples.get(stage)
+            if kept is not None:
+                kept.append(seconds)
+
+    def keep(self, *stages):
+        ''' Also keep each observed seconds of stages, for exact quantiles
+            where the histogram only has its buckets. '''
+        with self.lock:
+            for stage in stages:
+                self.samples.setdefault(stage, list())
+
+    def peak(self, name, value):
+        ''' Remember the highest value seen for name. '''
+        if not self.enabled:
+            return
+        with self.lock:
+            if value > self.peaks.get(name, 0):
+                self.peaks[name] = value
+
+    def export(self):
+        ''' The kept samples and the peaks, for merge() in another
+            process. '''
+        with self.lock:
+            samples = {stage: list(kept) for stage, kept in self.samples.items()}
+            return samples, dict(self.peaks)
+
+    def merge(self, exported):
+        ''' Add what export() returned in another process. Peaks add up, the
+            processes count disjoint things like their own frontiers. '''
+        samples, peaks = exported
+        with self.lock:
+            for stage, kept in samples.items():
+                self.samples.setdefault(stage, list()).extend(kept)
+            for name, value in peaks.items():
+                self.peaks[name] = self.peaks.get(name, 0) + value
+
+    def inc(self, name, count=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + count
+
+    def gauge(self, name, read):
+        ''' read() is called at scrape time and returns a number, or a dict
+            of label value to number for a labelled gauge. '''
+        self.gauges[name] = read
+
+    def render(self):
+        ''' Everything in the Prometheus text format. '''
+        with self.lock:
+            histograms = {
+                stage: (list(h.counts), h.total, h.count)
+                for stage, h in self.histograms.items()}
+            counters = dict(self.counters)
+        lines = list()
+        if histograms:
+            lines.append("# TYPE crawler_stage_seconds histogram")
+        for stage, (counts, total, count) in sorted(histograms.items()):
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS + ("+Inf",), counts):
+                cumulative += bucket
+                lines.append(
+                    f'crawler_stage_seconds_bucket{{stage="{stage}",'
+                    f'le="{bound}"}} {cumulative}')
+            lines.append(f'crawler_stage_seconds_sum{{stage="{stage}"}} {total}')
+            lines.append(f'crawler_stage_seconds_count{{stage="{stage}"}} {count}')
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE crawler_{name} counter")
+            for (other, labels), value in sorted(counters.items()):
+                if other == name:
+                    lines.append(f"crawler_{name}{format_labels(labels)} {value}")
+        for name, read in sorted(self.gauges.items()):
+            lines.append(f"# TYPE crawler_{name} gauge")
+            value = read()
+            if isinstance(value, dict):
+                for label, number in sorted(value.items()):
+                    lines.append(
+                        f"crawler_{name}{format_labels([('host', label)])} {number}")
+            else:
+                lines.append(f"crawler_{name} {value}")
+        lines.append(f"crawler_uptime_seconds {time.time() - self.started:.3f}")
+        return "\n".join(lines) + "\n"
+
+    def quantile(self, stage, fraction):
+        ''' Estimate of the fraction quantile of stage, interpolated within
+            its histogram bucket like Prometheus' histogram_quantile. '''
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None or not histogram.count:
+                return None
+            counts = list(histogram.counts)
+            rank = fraction * histogram.count
+        seen = 0
+        for i, bucket in enumerate(counts):
+            if seen + bucket >= rank and bucket:
+                if i == len(BUCKETS):
+                    return BUCKETS[-1]
+                lower = BUCKETS[i - 1] if i else 0
+                return lower + (BUCKETS[i] - lower) * (rank - seen) / bucket
+            seen += bucket
+        return BUCKETS[-1]
+
+    def summary(self, elapsed, pages):
+        ''' One line: pages/sec over elapsed and mean seconds per stage. '''
+        with self.lock:
+            stages = " ".join(
+                f"{stage}={h.total / h.count:.3f}s"
+                for stage, h in sorted(self.histograms.items()) if h.count)
+            errors = sum(
+                value for (name, _), value in self.counters.items()
+                if name == "errors_total")
+        depth = self.gauges.get("frontier_depth")
+        return (f"{pages / elapsed:.1f} pages/s, "
+                f"frontier {depth() if depth else 0}, errors {errors}, "
+                f"mean {stages or '-'}")
+
+    def _pages(self):
+        with self.lock:
+            return sum(
+                value for (name, _), value in self.counters.items()
+                if name == "pages_total")
+
+    def _report(self, interval, logger):
+        last = self._pages()
+        while True:
+            time.sleep(interval)
+            pages = self._pages()
+            logger.info(f"Metrics: {self.summary(interval, pages - last)}")
+            last = pages
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, metrics):
+        super().__init__(address, MetricsHandler)
+        self.metrics = metrics
+
+
+metrics = Metrics()
@@ -0,0 +1,88 @@
+import atexit
+import pickle
+from hashlib import blake2b
+from threading import Lock
+
+from utils import get_urlhash
+from utils.metrics import metrics
+
+# Pages remembered between syncs of the store. A lost entry only costs a
+# parse, while a dbm.dumb shelve rewrites its whole index on every sync.
+SYNC_EVERY = 256
+
+def content_digest(content):
+    return blake2b(content, digest_size=16).digest()
+
+
+class PageCache(object):
+    ''' What every crawled page looked like last time, kept next to the
+        frontier save file: a digest of its content, its ETag and
+        Last-Modified headers and the parsed page (outlinks, words, SimHash
+        fingerprint, but not the text). When a page comes back with a 304,
+        the same validators or the same content, lookup() returns the old
+        parse so the scraper can skip BeautifulSoup. '''
+    def __init__(self):
+        self.store = None
+        self.unsynced = 0
+        # shelve is not safe to share between threads.
+        self.lock = Lock()
+        atexit.register(self.close)
+
+    def attach(self, store):
+        ''' store is a mapping like the frontier's save, see open_store. '''
+        with self.lock:
+            if self.store is not None:
+                self.store.close()
+            self.store = store
+            self.unsynced = 0
+
+    def lookup(self, url, resp):
+        ''' The cached page of url if it is unchanged in resp, else None. '''
+        if self.store is None:
+            return None
+        with self.lock:
+            entry = self.store.get(get_urlhash(url))
+        if entry is None:
+            return None
+        digest, etag, modified, pickled = entry
+        raw = resp.raw_response
+        if resp.status == 304:
+            unchanged = True
+        elif raw is None or resp.status != 200:
+            unchanged = False
+        elif etag and raw.headers.get("ETag") == etag:
+            unchanged = True
+        elif modified and raw.headers.get("Last-Modified") == modified:
+            unchanged = True
+        else:
+            unchanged = content_digest(raw.content) == digest
+        if not unchanged:
+            return None
+        metrics.inc("unchanged_total")
+        return pickle.loads(pickled)
+
+    def remember(self, url, resp, page):
+        if self.store is None or resp.raw_response is None:
+            return
+        raw = resp.raw_response
+        # Pickled now, so no store holds on to the page and its tokens.
+        entry = (content_digest(raw.content), raw.headers.get("ETag"),
+                 raw.headers.get("Last-Modified"),
+                 pickle.dumps(page, pickle.HIGHEST_PROTOCOL))
+        with self.lock:
+            if self.store is None:
+                return
+            self.store[get_urlhash(url)] = entry
+            self.unsynced += 1
+            if self.unsynced >= SYNC_EVERY:
+                self.store.sync()
+                self.unsynced = 0
+
+    def close(self):
+        with self.lock:
+            if self.store is not None:
+                self.store.close()
+                self.store = None
+
+
+page_cache = PageCache()
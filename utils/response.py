@@ -1,14 +1,63 @@
 import pickle
 
+from utils.metrics import metrics
+
+HTML_TYPES = ("text/html", "application/xhtml+xml")
+
+
 class Response(object):
+    # Bodies not worth loading, set from MAXBODY and HTMLONLY.
+    max_body = 0
+    html_only = False
+
     def __init__(self, resp_dict):
         self.url = resp_dict["url"]
         self.status = resp_dict["status"]
         self.error = resp_dict["error"] if "error" in resp_dict else None
+        # The pickled requests.Response, only loaded when raw_response is
+        # first read, so pages rejected on status are never unpickled.
+        self._pickled = resp_dict.get("response")
+        self._raw_response = None
+        # Why raw_response is None although a response came back.
+        self.skipped = None
+        # Filled in by the downloader: seconds spent fetching, retries
+        # included, and how many requests that took.
+        self.latency = None
+        self.attempts = 1
+
+    @property
+    def raw_response(self):
+        if self._pickled is not None:
+            pickled, self._pickled = self._pickled, None
+            self._raw_response = self._load(pickled)
+        return self._raw_response
+
+    @raw_response.setter
+    def raw_response(self, raw_response):
+        self._pickled = None
+        self._raw_response = raw_response
+
+    def _skip(self, reason):
+        self.skipped = reason
+        metrics.inc("skipped_total", reason=reason)
+        return None
+
+    def _load(self, pickled):
+        # The pickle holds the whole body, its size bounds the body's.
+        if self.max_body and len(pickled) > self.max_body:
+            return self._skip("size")
         try:
-            self.raw_response = (
-                pickle.loads(resp_dict["response"])
-                if "response" in resp_dict else
-                None)
+            raw = pickle.loads(pickled)
         except TypeError:
-            self.raw_response = None
+            return None
+        headers = getattr(raw, "headers", None) or dict()
+        content_type = headers.get("Content-Type", "")
+        if (self.html_only and content_type
+                and not content_type.lower().startswith(HTML_TYPES)):
+            return self._skip("type")
+        return raw
+
+    @classmethod
+    def configure(cls, config):
+        cls.max_body = config.max_body
+        cls.html_only = config.html_only
@@ -0,0 +1,141 @@
+import os
+import time
+import pickle
+import urllib.error
+import urllib.request
+from threading import Lock, Event
+from urllib.robotparser import RobotFileParser
+
+from utils.metrics import metrics
+
+# Seconds a fetched robots.txt is trusted before it is fetched again.
+ROBOTS_TTL = 24 * 60 * 60
+# Seconds an unreachable robots.txt is remembered as "allow everything".
+NEGATIVE_TTL = 60 * 60
+FETCH_TIMEOUT = 10
+
+
+class RobotsEntry(object):
+    def __init__(self, expires, status, lines):
+        # status is the http status of the fetch, None if it failed.
+        self.expires = expires
+        self.status = status
+        self.lines = lines
+        self.parser = self._build_parser()
+
+    def _build_parser(self):
+        # Mirrors RobotFileParser.read() without doing the request.
+        parser = RobotFileParser()
+        if self.status is None:
+            parser.allow_all = True
+        elif self.status in (401, 403):
+            parser.disallow_all = True
+        elif 400 <= self.status < 500:
+            parser.allow_all = True
+        elif self.lines is not None:
+            parser.parse(self.lines)
+        return parser
+
+    def __getstate__(self):
+        return (self.expires, self.status, self.lines)
+
+    def __setstate__(self, state):
+        self.expires, self.status, self.lines = state
+        self.parser = self._build_parser()
+
+
+class RobotsCache(object):
+    ''' robots.txt parsers shared by every worker, keyed by netloc.
+        Concurrent lookups of an unknown netloc wait on a single fetch. '''
+    def __init__(self, ttl=ROBOTS_TTL, negative_ttl=NEGATIVE_TTL,
+                 timeout=FETCH_TIMEOUT):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+        self.entries = dict()
+        self.inflight = dict()
+        self.lock = Lock()
+        # Held across a save's write and replace, which share a tmp file.
+        self.save_lock = Lock()
+        self.path = None
+
+    def attach(self, path, restart=False):
+        ''' Persist the cache to path, loading what is there unless the
+            crawl is restarting. '''
+        with self.lock:
+            self.path = path
+            if restart and os.path.exists(path):
+                os.remove(path)
+            elif os.path.exists(path):
+                try:
+                    with open(path, "rb") as save:
+                        self.entries.update(pickle.load(save))
+                except (EOFError, pickle.UnpicklingError):
+                    pass
+
+    def save(self):
+        with self.save_lock:
+            with self.lock:
+                if self.path is None:
+                    return
+                entries = dict(self.entries)
+                path = self.path
+            tmp = f"{path}.tmp"
+            with open(tmp, "wb") as save:
+                pickle.dump(entries, save)
+            os.replace(tmp, path)
+
+    def can_fetch(self, url, netloc, useragent="*"):
+        return self.get(netloc).can_fetch(useragent, url)
+
+    def crawl_delay(self, netloc, useragent="*", fetch=True):
+        ''' With fetch False only a robots.txt already in the cache, even
+            an expired one, is read and None is returned for other hosts;
+            this never blocks on the network. '''
+        if not fetch:
+            with self.lock:
+                entry = self.entries.get(netloc)
+            return entry.parser.crawl_delay(useragent) if entry else None
+        return self.get(netloc).crawl_delay(useragent)
+
+    def get(self, netloc):
+        while True:
+            with self.lock:
+                entry = self.entries.get(netloc)
+                if entry is not None and entry.expires > time.time():
+                    return entry.parser
+                event = self.inflight.get(netloc)
+                fetching = event is None
+                if fetching:
+                    event = self.inflight[netloc] = Event()
+            if not fetching:
+                event.wait()
+                continue
+            try:
+                with metrics.timer("robots"):
+                    entry = self._fetch(netloc)
+                with self.lock:
+                    self.entries[netloc] = entry
+            finally:
+                with self.lock:
+                    del self.inflight[netloc]
+                event.set()
+            self.save()
+            return entry.parser
+
+    def _fetch(self, netloc):
+        try:
+            with urllib.request.urlopen(
+                    f"http://{netloc}/robots.txt", timeout=self.timeout) as f:
+                lines = f.read().decode("utf-8", "replace").splitlines()
+            return RobotsEntry(time.time() + self.ttl, 200, lines)
+        except urllib.error.HTTPError as err:
+            if err.code >= 500:
+                return RobotsEntry(time.time() + self.negative_ttl, err.code, None)
+            return RobotsEntry(time.time() + self.ttl, err.code, None)
+        except Exception:
+            # No robots.txt reachable for that website.
+            return RobotsEntry(time.time() + self.negative_ttl, None, None)
+
+
+robots_cache = RobotsCache()
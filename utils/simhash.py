@@ -0,0 +1,82 @@
+from hashlib import blake2b
+from functools import lru_cache
+from collections import Counter
+from threading import Lock
+
+BITS = 64
+# Fingerprints this many bits apart or closer are near duplicates.
+DISTANCE = 3
+# DISTANCE + 1 bands: two fingerprints within DISTANCE bits must agree
+# exactly on at least one band, so only those buckets need checking.
+BANDS = DISTANCE + 1
+BAND_BITS = BITS // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+# Every fingerprint bit gets its own 32 bit counter inside one big int, so a
+# token is added to all 64 counters with a single integer addition.
+FIELD = 32
+SPREAD_BYTE = [
+    sum(1 << (FIELD * bit) for bit in range(8) if byte >> bit & 1)
+    for byte in range(256)]
+
+
+@lru_cache(maxsize=100000)
+def _spread(token):
+    # Fingerprint bits of token, each moved to the start of its counter.
+    digest = blake2b(token.encode("utf-8"), digest_size=8).digest()
+    spread = 0
+    for i, byte in enumerate(reversed(digest)):
+        spread |= SPREAD_BYTE[byte] << (FIELD * 8 * i)
+    return spread
+
+
+def simhash(tokens):
+    ''' 64 bit SimHash of a token stream, each token weighted by its count. '''
+    counters = 0
+    total = 0
+    for token, weight in Counter(tokens).items():
+        counters += weight * _spread(token)
+        total += weight
+    fingerprint = 0
+    mask = (1 << FIELD) - 1
+    for bit in range(BITS):
+        # Set when the tokens with this bit set outweigh the ones without.
+        if 2 * (counters >> (FIELD * bit) & mask) > total:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+class SimHashIndex(object):
+    ''' Fingerprints of pages seen so far, bucketed by band so a lookup only
+        compares against pages sharing at least one band. '''
+    def __init__(self, max_distance=DISTANCE):
+        self.max_distance = max_distance
+        self.buckets = dict()
+        self.lock = Lock()
+
+    def _bands(self, fingerprint):
+        for band in range(BANDS):
+            yield band, fingerprint >> (band * BAND_BITS) & BAND_MASK
+
+    def find(self, fingerprint):
+        ''' url of an indexed page near fingerprint, or None. '''
+        for key in self._bands(fingerprint):
+            for other, url in self.buckets.get(key, ()):
+                if distance(fingerprint, other) <= self.max_distance:
+                    return url
+        return None
+
+    def check(self, url, fingerprint):
+        ''' url of the page this one (of simhash fingerprint) nearly
+            duplicates, or None after indexing it as a new page. '''
+        with self.lock:
+            original = self.find(fingerprint)
+            if original is not None:
+                return original
+            for key in self._bands(fingerprint):
+                self.buckets.setdefault(key, list()).append((fingerprint, url))
+        return None
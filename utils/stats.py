@@ -0,0 +1,289 @@
+import os
+import heapq
+import pickle
+import sqlite3
+from array import array
+from hashlib import blake2b
+from threading import RLock, Lock, Thread, Event
+from collections import defaultdict
+
+
+class TopK(object):
+    ''' The k items with the highest counts, kept up to date as counts grow.
+        Counts only ever increase, so an item can only enter the top when it
+        is updated and beats the current k-th. Old heap entries are skipped
+        lazily when they no longer match the item's count. '''
+    def __init__(self, k):
+        self.k = k
+        self.counts = dict()
+        self.heap = list()
+
+    def update(self, item, count):
+        if item not in self.counts:
+            if len(self.counts) >= self.k:
+                lowest, lowest_item = self._lowest()
+                if count <= lowest:
+                    return
+                heapq.heappop(self.heap)
+                del self.counts[lowest_item]
+        self.counts[item] = count
+        heapq.heappush(self.heap, (count, item))
+        if len(self.heap) > 4 * self.k:
+            self.heap = [(count, item) for item, count in self.counts.items()]
+            heapq.heapify(self.heap)
+
+    def _lowest(self):
+        while True:
+            count, item = self.heap[0]
+            if self.counts.get(item) == count:
+                return count, item
+            heapq.heappop(self.heap)
+
+    def items(self):
+        return sorted(self.counts.items(), key=lambda x: (-x[1], x[0]))
+
+
+class CountMinSketch(object):
+    ''' Approximate counts in fixed memory: depth rows of width counters.
+        Estimates never undercount; with conservative update they overcount
+        by little more than total / width. '''
+    def __init__(self, width=1 << 20, depth=4):
+        self.width = width
+        self.depth = depth
+        self.rows = [array("I", bytes(4 * width)) for _ in range(depth)]
+
+    def _cells(self, item):
+        digest = blake2b(item.encode("utf-8"), digest_size=4 * self.depth).digest()
+        return [int.from_bytes(digest[4 * row:4 * row + 4], "little") % self.width
+                for row in range(self.depth)]
+
+    def add(self, item, count=1):
+        ''' Add count to item and return its new estimate. '''
+        cells = self._cells(item)
+        estimate = min(row[cell] for row, cell in zip(self.rows, cells)) + count
+        for row, cell in zip(self.rows, cells):
+            if row[cell] < estimate:
+                row[cell] = estimate
+        return estimate
+
+    def __getitem__(self, item):
+        return min(row[cell] for row, cell in zip(self.rows, self._cells(item)))
+
+    def merge(self, rows):
+        ''' Add the counters of a sketch of the same shape. '''
+        for row, other in zip(self.rows, rows):
+            for cell, count in enumerate(other):
+                if count:
+                    row[cell] += count
+
+
+class SketchCounter(object):
+    ''' Word counts in bounded memory: a count-min sketch for every word and
+        exact bookkeeping only for the current top k. '''
+    def __init__(self, k=50, width=1 << 20, depth=4):
+        self.sketch = CountMinSketch(width, depth)
+        self.top = TopK(k)
+
+    def add(self, word, count=1):
+        self.top.update(word, self.sketch.add(word, count))
+
+    def top_items(self):
+        return self.top.items()
+
+    def most_common(self, n):
+        return self.top.items()[:n]
+
+    def snapshot(self):
+        # Copies, the checkpoint is pickled after the stats lock is let go
+        # while workers keep counting into the live rows.
+        return ([array("I", row) for row in self.sketch.rows], self.top.items())
+
+    def merge(self, snapshot):
+        rows, top_items = snapshot
+        self.sketch.merge(rows)
+        for word in set(self.top.counts) | {word for word, _ in top_items}:
+            self.top.update(word, self.sketch[word])
+
+
+class ExactCounter(object):
+    ''' Exact word counts. With max_words set, once more words than that are
+        in memory the less frequent half is moved to a sqlite file at
+        spill_path, and a spilled word is moved back when it shows up again,
+        so the in-memory count of a word is always its full count. '''
+    def __init__(self, k=50, max_words=0, spill_path=None):
+        self.counts = dict()
+        self.top = TopK(k)
+        self.max_words = max_words
+        self.spill_path = spill_path
+        self.db = None
+
+    def add(self, word, count=1):
+        total = self.counts.get(word)
+        if total is None:
+            total = self._unspill(word)
+            if self.max_words and len(self.counts) >= self.max_words:
+                self._spill()
+        total += count
+        self.counts[word] = total
+        self.top.update(word, total)
+
+    def _unspill(self, word):
+        if self.db is None:
+            return 0
+        row = self.db.execute(
+            "SELECT count FROM words WHERE word = ?", (word,)).fetchone()
+        if row is None:
+            return 0
+        self.db.execute("DELETE FROM words WHERE word = ?", (word,))
+        return row[0]
+
+    def _spill(self):
+        if self.db is None:
+            if os.path.exists(self.spill_path):
+                os.remove(self.spill_path)
+            self.db = sqlite3.connect(self.spill_path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE words (word TEXT PRIMARY KEY, count INTEGER)")
+            self.db.execute("CREATE INDEX by_count ON words (count)")
+        spilled = heapq.nsmallest(
+            len(self.counts) // 2, self.counts.items(), key=lambda x: x[1])
+        self.db.executemany("INSERT INTO words VALUES (?, ?)", spilled)
+        self.db.commit()
+        for word, _ in spilled:
+            del self.counts[word]
+
+    def items(self):
+        yield from self.counts.items()
+        if self.db is not None:
+            yield from self.db.execute("SELECT word, count FROM words")
+
+    def snapshot(self):
+        return list(self.items())
+
+    def merge(self, snapshot):
+        for word, count in snapshot:
+            self.add(word, count)
+
+    def top_items(self):
+        ''' The incrementally kept top k, cheap enough to log every page. '''
+        return self.top.items()
+
+    def most_common(self, n):
+        ''' Exact top n with ties broken alphabetically, for the report. '''
+        order = lambda x: (-x[1], x[0])
+        candidates = heapq.nsmallest(n, self.counts.items(), key=order)
+        if self.db is not None:
+            candidates += self.db.execute(
+                "SELECT word, count FROM words "
+                "ORDER BY count DESC, word LIMIT ?", (n,)).fetchall()
+        return sorted(candidates, key=order)[:n]
+
+
+class CrawlStats(object):
+    ''' What the report is built from. Workers update it under self.lock.
+        Every REPORTEVERY pages a background thread writes a snapshot to
+        <SAVE>.stats and runs the on_checkpoint hooks; a resumed crawl
+        starts from the last snapshot. '''
+    def __init__(self):
+        self.lock = RLock()
+        self.unique_pages = set()
+        self.longest_page = {'url': 'default', 'length': 0}
+        self.word_frequency = ExactCounter()
+        self.sub_domains = defaultdict(int)
+        # Store 8 byte digests of unique pages instead of the urls.
+        self.compact_pages = False
+        self.pages = 0
+        self.checkpoint_path = None
+        self.checkpoint_every = 0
+        self.checkpoint_due = Event()
+        self.checkpoint_lock = Lock()
+        self.checkpointer = None
+        self.on_checkpoint = list()
+
+    def configure(self, config):
+        with self.lock:
+            if config.stats == "sketch":
+                self.word_frequency = SketchCounter()
+                self.compact_pages = True
+            elif config.stats == "exact":
+                self.word_frequency = ExactCounter(
+                    max_words=config.stats_words,
+                    spill_path=f"{config.save_file}.words")
+            else:
+                raise ValueError(f"Unknown STATS {config.stats!r}, "
+                                 f"expected 'exact' or 'sketch'.")
+            self.checkpoint_path = f"{config.save_file}.stats"
+            self.checkpoint_every = config.report_every
+            if self.checkpoint_every and (
+                    self.checkpointer is None or not self.checkpointer.is_alive()):
+                self.checkpointer = Thread(
+                    target=self._checkpoint_loop, daemon=True)
+                self.checkpointer.start()
+
+    def add_page(self, page, words, length, in_ics):
+        ''' Count one crawled page (scheme://netloc/path), its words for the
+            frequency table and its length in words. '''
+        with self.lock:
+            if self.compact_pages:
+                self.unique_pages.add(
+                    blake2b(page.encode("utf-8"), digest_size=8).digest())
+            else:
+                self.unique_pages.add(page)
+            if length > self.longest_page['length']:
+                self.longest_page['length'] = length
+                self.longest_page['url'] = page
+            for word in words:
+                self.word_frequency.add(word)
+            if in_ics:
+                self.sub_domains[page] += 1
+            self.pages += 1
+            if self.checkpoint_every and self.pages % self.checkpoint_every == 0:
+                self.checkpoint_due.set()
+
+    def _checkpoint_loop(self):
+        while True:
+            self.checkpoint_due.wait()
+            self.checkpoint_due.clear()
+            self.save_checkpoint()
+
+    def save_checkpoint(self):
+        ''' Replace the checkpoint file with a snapshot of now. '''
+        if self.checkpoint_path is None:
+            return
+        with self.checkpoint_lock:
+            snapshot = self.snapshot()
+            tmp = f"{self.checkpoint_path}.tmp"
+            with open(tmp, "wb") as checkpoint:
+                pickle.dump(snapshot, checkpoint, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.checkpoint_path)
+        for hook in self.on_checkpoint:
+            hook()
+
+    def load_checkpoint(self, path=None):
+        ''' Merge the checkpoint at path, by default the configured one.
+            Returns False if there is none. '''
+        path = path or self.checkpoint_path
+        if path is None or not os.path.exists(path):
+            return False
+        with open(path, "rb") as checkpoint:
+            self.merge(pickle.load(checkpoint))
+        return True
+
+    def snapshot(self):
+        ''' Picklable copy of everything, see merge. '''
+        with self.lock:
+            return {
+                "unique_pages": set(self.unique_pages),
+                "longest_page": dict(self.longest_page),
+                "word_frequency": self.word_frequency.snapshot(),
+                "sub_domains": dict(self.sub_domains)}
+
+    def merge(self, snapshot):
+        ''' Fold in the snapshot of another crawl process. '''
+        with self.lock:
+            self.unique_pages |= snapshot["unique_pages"]
+            if snapshot["longest_page"]['length'] > self.longest_page['length']:
+                self.longest_page = dict(snapshot["longest_page"])
+            self.word_frequency.merge(snapshot["word_frequency"])
+            for page, count in snapshot["sub_domains"].items():
+                self.sub_domains[page] += count
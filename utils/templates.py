@@ -0,0 +1,127 @@
+import os
+import re
+import pickle
+from threading import Lock
+from urllib.parse import urlparse, parse_qsl
+
+from utils.metrics import metrics
+
+DIGITS = re.compile(r"\d+")
+# Weight of the newest page in a template's recent yield.
+YIELD_WEIGHT = 0.05
+
+
+def url_template(url):
+    ''' url with numbers (and so dates) masked and only the names of query
+        parameters, so /page/7?id=3 and /page/8?id=4 share a template. '''
+    parsed = urlparse(url)
+    keys = sorted({key for key, _ in parse_qsl(parsed.query)})
+    return f"{parsed.netloc.lower()}{DIGITS.sub('#', parsed.path)}?{'&'.join(keys)}"
+
+
+class TemplateStats(object):
+    def __init__(self):
+        self.fetches = 0
+        self.new = 0
+        # Share of recent pages with new content, scored by fetched().
+        self.recent = 1.0
+        self.scored = 0
+
+
+class TemplateBudget(object):
+    ''' Crawl budgets per url template, for traps no rule in url_filter
+        knows yet. Every fetch and every page with new content (good enough
+        and not a near duplicate) is counted per template. Once a template
+        has TEMPLATEMIN fetches and its recent yield is under TEMPLATEYIELD
+        it is capped: its links are invalid and its queued urls are dropped.
+        Counts and caps are kept in <SAVE>.templates. '''
+    def __init__(self):
+        self.templates = dict()
+        self.capped = set()
+        self.min_fetches = 0
+        self.min_yield = 0
+        self.path = None
+        self.lock = Lock()
+        # Held across a save's write and replace, which share a tmp file.
+        self.save_lock = Lock()
+
+    def configure(self, config, restart=False):
+        self.min_fetches = config.template_min
+        self.min_yield = config.template_yield
+        self.path = f"{config.save_file}.templates"
+        with self.lock:
+            self.templates = dict()
+            self.capped = set()
+        if restart and os.path.exists(self.path):
+            os.remove(self.path)
+        else:
+            self.load()
+
+    def load(self, path=None):
+        ''' Merge the counts and caps saved at path, by default the
+            configured one. Returns False if there are none. '''
+        path = path or self.path
+        if path is None or not os.path.exists(path):
+            return False
+        with open(path, "rb") as saved:
+            templates, capped = pickle.load(saved)
+        with self.lock:
+            self.templates.update(templates)
+            self.capped.update(capped)
+        return True
+
+    def save(self):
+        if self.path is None:
+            return
+        with self.save_lock:
+            with self.lock:
+                state = pickle.dumps((self.templates, self.capped),
+                                     pickle.HIGHEST_PROTOCOL)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "wb") as saved:
+                saved.write(state)
+            os.replace(tmp, self.path)
+
+    def _stats(self, template):
+        # Caller holds self.lock.
+        stats = self.templates.get(template)
+        if stats is None:
+            stats = self.templates[template] = TemplateStats()
+        return stats
+
+    def new_content(self, url):
+        ''' Count a page of url that added content to the crawl. '''
+        with self.lock:
+            self._stats(url_template(url)).new += 1
+
+    def fetched(self, url):
+        ''' Count a download of url, after new_content if it had any. '''
+        template = url_template(url)
+        with self.lock:
+            stats = self._stats(template)
+            stats.fetches += 1
+            hit = min(stats.new - stats.scored, 1)
+            stats.scored = stats.new
+            stats.recent += YIELD_WEIGHT * (hit - stats.recent)
+            cap = (self.min_yield and template not in self.capped
+                   and stats.fetches >= self.min_fetches
+                   and stats.recent < self.min_yield)
+            if cap:
+                self.capped.add(template)
+        if cap:
+            metrics.inc("templates_capped_total")
+            self.save()
+
+    def is_capped(self, url):
+        return bool(self.capped) and url_template(url) in self.capped
+
+    def top(self, count=20):
+        ''' (template, stats, capped) of the most fetched templates. '''
+        with self.lock:
+            ranked = sorted(self.templates.items(),
+                            key=lambda item: item[1].fetches, reverse=True)
+            return [(template, stats, template in self.capped)
+                    for template, stats in ranked[:count]]
+
+
+template_budget = TemplateBudget()
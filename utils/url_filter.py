@@ -0,0 +1,117 @@
+import re
+from functools import lru_cache
+from urllib.parse import urlparse, parse_qs
+
+# Verdicts remembered for this many distinct urls.
+MEMO_SIZE = 1 << 18
+
+EXTENSIONS = (
+    "css|js|bmp|gif|jpe?g|ico"
+    "|png|tiff?|mid|mp2|mp3|mp4"
+    "|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
+    "|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
+    "|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
+    "|epub|dll|cnf|tgz|sha1"
+    "|thmx|mso|arff|rtf|jar|csv"
+    "|rm|smil|wmv|swf|wma|zip|rar|gz")
+EXTRA_DIRECTORIES = (
+    "(/misc|/sites|/all|/themes|/modules|/profiles|/css|/field|/node|/theme){3}")
+CLUB_PAGES = "(calendar|date|gallery|image|wp-content|pdf|img_)"
+MONTH_ARCHIVE = r"/20\d\d-\d"
+
+EXTENSION_PATTERN = re.compile(rf"\.({EXTENSIONS})$")
+EXTRA_DIRECTORIES_PATTERN = re.compile(EXTRA_DIRECTORIES)
+CLUB_PAGES_PATTERN = re.compile(CLUB_PAGES)
+MONTH_ARCHIVE_PATTERN = re.compile(MONTH_ARCHIVE)
+# Unchanged from the original rule: in this non-raw string \1 and \2 are
+# control characters rather than backreferences.
+REPEATING_DIRECTORIES_PATTERN = re.compile(
+    "^.*?(/.+?/).*?\1.*$|^.*?/(.+?/)\2.*$")
+# One search over the lowercased path that every path based rule below
+# needs to hit. Paths it misses skip the individual checks entirely.
+PATH_PREFILTER = re.compile(
+    rf"session|{EXTRA_DIRECTORIES}|{CLUB_PAGES}|{MONTH_ARCHIVE}"
+    r"|/events?/|[\1\2]")
+
+
+def has_repeated_path(url):
+    ''' Same answer as re.findall(r"(.+/)\\1+", url), which backtracks over
+        every substring: is some "x/" (x not empty) directly followed by
+        itself? Both copies end in a slash, so only pairs of slashes need
+        comparing. '''
+    slashes = list()
+    slash = url.find("/")
+    while slash != -1:
+        slashes.append(slash)
+        slash = url.find("/", slash + 1)
+    for a, first in enumerate(slashes):
+        for second in slashes[a + 1:]:
+            length = second - first
+            start = first + 1 - length
+            if length < 2 or start < 0:
+                continue
+            if url[start:first + 1] == url[first + 1:second + 1]:
+                return True
+    return False
+
+
+class UrlFilter(object):
+    ''' The static part of scraper.is_valid: every rule except robots.txt,
+        compiled once. check(url) is memoized per url and returns
+        (parsed, reason before robots, reason after robots), where a reason
+        of "" means the url passed that half. parsed may be None when the
+        first reason is set. '''
+    def __init__(self, seeds, memo_size=MEMO_SIZE):
+        self.seed_pattern = re.compile("|".join(map(re.escape, seeds)))
+        self.check = lru_cache(maxsize=memo_size)(self._check)
+
+    def _check(self, url):
+        if url.startswith(("http://", "https://")) and not self.seed_pattern.search(url):
+            # Most outlinks leave the seed domains, no need to parse those.
+            return None, "Non-seed-url", ""
+        parsed = urlparse(url)
+        if parsed.scheme not in ("http", "https"):
+            return parsed, "Https missing", ""
+        if not self.seed_pattern.search(url):
+            return parsed, "Non-seed-url", ""
+        trap = self.trap_reason(parsed)
+        if trap:
+            return parsed, "", f"Is a Trap - {trap}"
+        if EXTENSION_PATTERN.search(parsed.path.lower()):
+            return parsed, "", "Re Matching Failed"
+        return parsed, "", ""
+
+    def trap_reason(self, parsed):
+        ''' Name of the first trap rule parsed hits, or "". Rules are
+            checked in the order of the original is_trap. '''
+        full_url = parsed.geturl()
+        if len(full_url) > 200:
+            return "Long url traps"
+        if has_repeated_path(f"{full_url}/"):
+            return "Duplicate Path Trap"
+
+        path = parsed.path
+        lower_path = path.lower()
+        query = parsed.query
+        if not PATH_PREFILTER.search(lower_path):
+            if "session" in query:
+                return "Session Trap"
+            if query.count("=") > 7 and len(parse_qs(query)) > 7:
+                return "Dynamic Trap"
+            return ""
+
+        if "session" in lower_path.split("/")[1:] or "session" in query:
+            return "Session Trap"
+        if REPEATING_DIRECTORIES_PATTERN.match(path):
+            return "Repeating Directories Trap"
+        if EXTRA_DIRECTORIES_PATTERN.search(path):
+            return "Extra Directories Trap"
+        if query.count("=") > 7 and len(parse_qs(query)) > 7:
+            return "Dynamic Trap"
+        if CLUB_PAGES_PATTERN.search(lower_path):
+            return "Club Page Trap"
+        if MONTH_ARCHIVE_PATTERN.search(lower_path):
+            return "Month Trap"
+        if "/event/" in path or "/events/" in path:
+            return "Calendar Trap"
+        return ""